@@ -0,0 +1,97 @@
+"""Throughput test for the broadcast engine against a fake Bot that simulates flood waits.
+
+Run from the repository root:
+
+    python benchmarks/bench_broadcast.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.methods import CopyMessage  # noqa: E402
+
+import susninja  # noqa: E402
+
+TARGETS = 600
+GLOBAL_RATE = 200
+LATENCY = 0.02
+FLOOD_PROBABILITY = 0.02
+FLOOD_WAIT = 1
+
+
+class FakeBot:
+    """Accepts copy_message calls, enforcing the global rate and randomly answering with flood waits"""
+
+    def __init__(self, rate: float):
+        self.rng = random.Random(3)
+        self.window = []
+        self.rate = rate
+        self.delivered = set()
+        self.flood_waits = 0
+        self.rate_violations = 0
+
+    async def copy_message(self, chat_id: int, from_chat_id: int, message_id: int):
+        now = time.monotonic()
+        self.window = [t for t in self.window if now - t < 1.0]
+        self.window.append(now)
+        if len(self.window) > self.rate * 1.1 + 1:
+            self.rate_violations += 1
+
+        await asyncio.sleep(LATENCY)
+        if self.rng.random() < FLOOD_PROBABILITY:
+            self.flood_waits += 1
+            method = CopyMessage(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=FLOOD_WAIT)
+        self.delivered.add(chat_id)
+
+
+class FakeSummaryMessage:
+    def __init__(self):
+        self.edits = 0
+        self.text = ""
+
+    async def edit_text(self, text: str, **kwargs):
+        self.edits += 1
+        self.text = text
+
+
+async def run(cancel_after: float = None) -> None:
+    fake_bot = FakeBot(GLOBAL_RATE)
+    susninja.bot = fake_bot
+    susninja.BROADCAST_GLOBAL_RATE = GLOBAL_RATE
+    susninja.BROADCAST_PROGRESS_INTERVAL = 0.5
+
+    summary = FakeSummaryMessage()
+    job = susninja.BroadcastJob(susninja.OWNER_ID, "users", list(range(TARGETS)), 1, 1)
+    start = time.perf_counter()
+    task = asyncio.create_task(susninja.run_broadcast(job, summary))
+    if cancel_after is not None:
+        await asyncio.sleep(cancel_after)
+        susninja.active_broadcasts[susninja.OWNER_ID].cancel()
+    await task
+    elapsed = time.perf_counter() - start
+
+    label = "cancelled" if cancel_after is not None else "full run"
+    print(
+        f"{label:<10} sent {job.sent:>5}  failed {job.failed:>3}  retried {job.retried:>3}  "
+        f"{job.done / elapsed:7.1f} msg/s  ({elapsed:.2f}s, {summary.edits} summary edits, "
+        f"{fake_bot.rate_violations} rate violations)"
+    )
+    if cancel_after is None:
+        assert len(fake_bot.delivered) == job.sent, "duplicate or lost deliveries"
+        assert job.done == TARGETS, "targets left unprocessed"
+    else:
+        assert job.done < TARGETS, "cancel did not stop the broadcast"
+    assert "Broadcast Summary" in summary.text
+
+
+if __name__ == "__main__":
+    print(f"{TARGETS} targets, global limit {GLOBAL_RATE} msg/s, {susninja.BROADCAST_WORKERS} workers, "
+          f"{LATENCY * 1000:.0f}ms latency, {FLOOD_PROBABILITY:.0%} flood waits of {FLOOD_WAIT}s")
+    asyncio.run(run())
+    asyncio.run(run(cancel_after=1.0))
@@ -0,0 +1,86 @@
+"""Benchmark: word-level edit deltas and the inline diff shown on reveal, over large captions.
+
+Measures the delta recorded per edit, the first (cold) reveal render and a
+repeated reveal served from the per-edit memo. Run from the repository root:
+
+    python benchmarks/bench_diff.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from susninja import EditHistory, make_delta, render_edit_notification, tokenize  # noqa: E402
+
+ROUNDS = 500
+EDITS = 5
+BASE_WORDS = ["sus", "ninja", "caught", "typo", "<tag>", "a&b", "fixed", "again", "photo", "caption", "lol", "why"]
+WORDS = BASE_WORDS + [f"{word}{index}" for index in range(200) for word in BASE_WORDS]
+
+
+def make_text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def mutate(rng: random.Random, text: str) -> str:
+    # A typo fix or two: replace, insert or drop a few words
+    words = text.split(" ")
+    for _ in range(rng.randrange(1, 4)):
+        index = rng.randrange(len(words))
+        action = rng.random()
+        if action < 0.5:
+            words[index] = rng.choice(WORDS)
+        elif action < 0.8:
+            words.insert(index, rng.choice(WORDS))
+        elif len(words) > 1:
+            del words[index]
+    return " ".join(words)
+
+
+def run(length: int) -> None:
+    rng = random.Random(length)
+    chains = []
+    for _ in range(ROUNDS):
+        versions = [make_text(rng, length)]
+        for _ in range(EDITS):
+            versions.append(mutate(rng, versions[-1]))
+        chains.append(versions)
+
+    start = time.perf_counter()
+    for versions in chains:
+        make_delta(tokenize(versions[1]), tokenize(versions[0]))
+    delta_us = (time.perf_counter() - start) / ROUNDS * 1e6
+
+    histories = []
+    for versions in chains:
+        history = EditHistory(versions[0], 1, "Editor")
+        for text in versions[1:]:
+            history.add_version(text)
+        histories.append(history)
+
+    start = time.perf_counter()
+    for history in histories:
+        render_edit_notification(history, revealed=True)
+    cold_us = (time.perf_counter() - start) / ROUNDS * 1e6
+
+    start = time.perf_counter()
+    for history in histories:
+        render_edit_notification(history, revealed=True)
+    warm_us = (time.perf_counter() - start) / ROUNDS * 1e6
+
+    print(f"{length:>6} chars  delta/edit {delta_us:8.1f} us   "
+          f"reveal ({EDITS} edits) cold {cold_us:8.1f} us   memoized {warm_us:6.2f} us")
+
+
+if __name__ == "__main__":
+    print(f"{ROUNDS} edited messages per size")
+    for length in (200, 1024, 4096):
+        run(length)
@@ -0,0 +1,53 @@
+"""Benchmark: handler cost with logging at DEBUG, INFO and WARNING.
+
+Log output goes to os.devnull; records are formatted and written on the
+listener thread, so this measures what the event loop itself pays.
+Run from the repository root:
+
+    python benchmarks/bench_logging.py
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import Chat, Message, User  # noqa: E402
+
+import susninja  # noqa: E402
+
+MESSAGES = 20000
+CHATS = 50
+
+
+def make_messages() -> list:
+    now = datetime.now(timezone.utc)
+    users = [User(id=1000 + i, is_bot=False, first_name=f"User{i}", username=f"user_{i}") for i in range(100)]
+    chats = [Chat(id=-1001000000000 - i, type="supergroup", title=f"Group {i}") for i in range(CHATS)]
+    return [
+        Message(message_id=i, date=now, chat=chats[i % CHATS], from_user=users[i % 100], text=f"hello number {i}")
+        for i in range(MESSAGES)
+    ]
+
+
+async def run(level: int, messages: list) -> float:
+    susninja.logger.setLevel(level)
+    susninja.message_store = susninja.MessageStore()
+    start = time.perf_counter()
+    for message in messages:
+        await susninja.handle_message(message)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+if __name__ == "__main__":
+    devnull = open(os.devnull, "w")
+    susninja.log_listener.stream = devnull
+
+    messages = make_messages()
+    print(f"handle_message over {MESSAGES} group messages in {CHATS} chats")
+    for level in (logging.DEBUG, logging.INFO, logging.WARNING):
+        cost = asyncio.run(run(level, messages))
+        print(f"{logging.getLevelName(level):<8} {cost:8.2f} us/update  ({susninja.log_queue.dropped} records dropped)")
@@ -0,0 +1,88 @@
+"""Memory benchmark: bytes per cached message, 9-key dict records vs CachedMessage.
+
+Run from the repository root:
+
+    python benchmarks/bench_message_memory.py
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import User  # noqa: E402
+
+from susninja import CachedMessage, MessageStore, UserTable  # noqa: E402
+
+CHATS = 20
+MESSAGES_PER_CHAT = 1000
+USERS = 300
+WORDS = ["sus", "ninja", "edit", "caught", "hello", "group", "message", "again", "why", "lol"]
+
+
+def make_stream():
+    rng = random.Random(7)
+    users = [
+        User(id=1000 + i, is_bot=False, first_name=f"First{i}", last_name=f"Last{i}", username=f"user_{i}")
+        for i in range(USERS)
+    ]
+    stream = []
+    for message_id in range(MESSAGES_PER_CHAT):
+        for chat_id in range(CHATS):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randrange(2, 12)))
+            stream.append((chat_id, message_id, text, rng.choice(users)))
+    return stream
+
+
+def build_dicts(stream):
+    messages = {}
+    for chat_id, message_id, text, user in stream:
+        chat = messages.setdefault(chat_id, OrderedDict())
+        chat[message_id] = {
+            'message_id': message_id,
+            'text': text,
+            'user_id': user.id,
+            'username': str(user.username),
+            'first_name': str(user.first_name),
+            'last_name': str(user.last_name),
+            'timestamp': time.time(),
+            'date': datetime.now(timezone.utc),
+            'reply_to_message_id': None
+        }
+    return messages
+
+
+def build_records(stream):
+    users = UserTable()
+    store = MessageStore(max_per_chat=MESSAGES_PER_CHAT)
+    now = int(time.time())
+    for chat_id, message_id, text, user in stream:
+        store.add(chat_id, message_id, CachedMessage(message_id, text, users.remember(user), now, now, None))
+    return users, store
+
+
+def measure(build, stream) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(stream)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    # Message text is shared with the stream in both layouts, so only record overhead is counted
+    return (after - before) / len(stream)
+
+
+if __name__ == "__main__":
+    stream = make_stream()
+    print(f"{CHATS} chats x {MESSAGES_PER_CHAT} messages from {USERS} users")
+    dict_bytes = measure(build_dicts, stream)
+    record_bytes = measure(build_records, stream)
+    print(f"dict records      {dict_bytes:8.1f} bytes/message")
+    print(f"CachedMessage     {record_bytes:8.1f} bytes/message")
+    print(f"saving            {100 * (1 - record_bytes / dict_bytes):8.1f} %")
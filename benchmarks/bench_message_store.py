@@ -0,0 +1,94 @@
+"""Micro-benchmark: MessageStore vs the old messages/chat_queues/recent_message_ids layout.
+
+Run from the repository root:
+
+    python benchmarks/bench_message_store.py
+"""
+import os
+import random
+import sys
+import time
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from susninja import MAX_MESSAGES_PER_CHAT, CachedMessage, MessageStore  # noqa: E402
+
+CHATS = 50
+MESSAGES_PER_CHAT = 5000
+REMOVALS = 20000
+
+
+class LegacyStore:
+    """The three-structure layout that MessageStore replaced"""
+
+    def __init__(self, max_per_chat: int = MAX_MESSAGES_PER_CHAT):
+        self.max_per_chat = max_per_chat
+        self.messages = defaultdict(dict)
+        self.chat_queues = defaultdict(lambda: deque(maxlen=max_per_chat))
+        self.recent_message_ids = defaultdict(set)
+
+    def add(self, chat_id, message_id, msg_data):
+        self.messages[chat_id][message_id] = msg_data
+        self.recent_message_ids[chat_id].add(message_id)
+        queue = self.chat_queues[chat_id]
+        if len(queue) >= self.max_per_chat:
+            oldest_msg_id = queue.popleft()
+            self.messages[chat_id].pop(oldest_msg_id, None)
+            self.recent_message_ids[chat_id].discard(oldest_msg_id)
+        queue.append(message_id)
+
+    def get(self, chat_id, message_id):
+        return self.messages.get(chat_id, {}).get(message_id)
+
+    def remove(self, chat_id, message_id):
+        msg_data = self.messages.get(chat_id, {}).pop(message_id, None)
+        if msg_data:
+            try:
+                self.chat_queues[chat_id].remove(message_id)
+            except ValueError:
+                pass
+            self.recent_message_ids[chat_id].discard(message_id)
+        return msg_data
+
+
+def make_records() -> list:
+    # Both stores get the very same objects, so only the store itself is timed
+    return [CachedMessage(message_id, "", None, 0, 0, None) for message_id in range(MESSAGES_PER_CHAT)]
+
+
+def run(store, records: list, label: str) -> None:
+    rng = random.Random(42)
+
+    start = time.perf_counter()
+    for message_id, record in enumerate(records):
+        for chat_id in range(CHATS):
+            store.add(chat_id, message_id, record)
+    add_time = time.perf_counter() - start
+
+    live_ids = range(MESSAGES_PER_CHAT - MAX_MESSAGES_PER_CHAT, MESSAGES_PER_CHAT)
+    lookups = [(rng.randrange(CHATS), rng.choice(live_ids)) for _ in range(REMOVALS)]
+
+    start = time.perf_counter()
+    for chat_id, message_id in lookups:
+        store.get(chat_id, message_id)
+    get_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for chat_id, message_id in lookups:
+        store.remove(chat_id, message_id)
+    remove_time = time.perf_counter() - start
+
+    adds = CHATS * MESSAGES_PER_CHAT
+    print(
+        f"{label:<14} add {adds / add_time:>12,.0f}/s   "
+        f"get {REMOVALS / get_time:>12,.0f}/s   "
+        f"remove {REMOVALS / remove_time:>12,.0f}/s"
+    )
+
+
+if __name__ == "__main__":
+    print(f"{CHATS} chats x {MESSAGES_PER_CHAT} messages, cap {MAX_MESSAGES_PER_CHAT}/chat, {REMOVALS} random removals")
+    records = make_records()
+    run(LegacyStore(), records, "three-structure")
+    run(MessageStore(), records, "MessageStore")
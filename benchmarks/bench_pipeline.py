@@ -0,0 +1,265 @@
+"""Replay benchmark for the whole update pipeline, fully offline.
+
+Feeds a synthetic (or recorded) stream of group messages, edits, callback
+presses and joins across N chats through dp.feed_update, with a fake Bot
+session standing in for the Telegram API. Reports updates/sec, p50/p99
+handler latency per update kind, the cost of a full expiry sweep and peak RSS
+above the baseline taken before the first update.
+
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py --updates 50000 --chats 200
+    python benchmarks/bench_pipeline.py --record stream.jsonl
+    python benchmarks/bench_pipeline.py --replay stream.jsonl
+    python benchmarks/bench_pipeline.py --concurrency 64 --api-latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Iterator
+
+os.environ.setdefault("PERSISTENCE_BACKEND", "none")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import (  # noqa: E402
+    AnswerCallbackQuery,
+    CopyMessage,
+    DeleteMessage,
+    EditMessageText,
+    GetChatAdministrators,
+    GetMe,
+)
+from aiogram.types import (  # noqa: E402
+    Chat,
+    ChatMemberAdministrator,
+    ChatMemberOwner,
+    Message,
+    MessageId,
+    Update,
+    User,
+)
+
+import susninja  # noqa: E402
+
+BOT_TOKEN = "123456:TEST-TOKEN"
+BOT_ID = 123456
+WORDS = ["sus", "ninja", "edit", "caught", "hello", "group", "message", "again", "why", "lol", "typo", "fixed"]
+
+
+class FakeSession(BaseSession):
+    """Answers every Bot API method locally with a plausible result"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+        self._next_message_id = 10_000_000
+        self._bot_user = User(id=BOT_ID, is_bot=True, first_name="Sus Ninja", username="SusNinjaBot")
+        self._owner = User(id=susninja.OWNER_ID, is_bot=False, first_name="Owner")
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if isinstance(method, GetMe):
+            return self._bot_user
+        if isinstance(method, GetChatAdministrators):
+            return [
+                ChatMemberOwner(user=self._owner, is_anonymous=False),
+                ChatMemberAdministrator(
+                    user=self._bot_user, can_be_edited=False, is_anonymous=False, can_manage_chat=True,
+                    can_delete_messages=True, can_manage_video_chats=False, can_restrict_members=True,
+                    can_promote_members=False, can_change_info=False, can_invite_users=True,
+                    can_post_stories=False, can_edit_stories=False, can_delete_stories=False
+                ),
+            ]
+        if isinstance(method, (AnswerCallbackQuery, DeleteMessage)):
+            return True
+        if isinstance(method, CopyMessage):
+            return MessageId(message_id=self._new_message_id())
+
+        chat_id = getattr(method, "chat_id", None) or 0
+        if isinstance(method, EditMessageText):
+            return Message(
+                message_id=method.message_id or self._new_message_id(), date=datetime.now(timezone.utc),
+                chat=Chat(id=chat_id, type="supergroup"), from_user=self._bot_user, text=method.text
+            ).as_(bot)
+        return Message(
+            message_id=self._new_message_id(), date=datetime.now(timezone.utc),
+            chat=Chat(id=chat_id, type="supergroup"), from_user=self._bot_user,
+            text=getattr(method, "text", None) or getattr(method, "caption", None) or ""
+        ).as_(bot)
+
+    def _new_message_id(self) -> int:
+        self._next_message_id += 1
+        return self._next_message_id
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        if False:
+            yield b""
+
+    async def close(self):
+        pass
+
+
+def generate_stream(updates: int, chats: int, seed: int) -> Iterator[dict]:
+    """Mixed stream: ~70% messages, ~15% edits, ~10% callback presses, ~5% joins, generated lazily"""
+    rng = random.Random(seed)
+    now = int(time.time())
+    users = [{"id": 1000 + i, "is_bot": False, "first_name": f"User{i}", "username": f"user_{i}"} for i in range(500)]
+    chat_objects = [{"id": -1001000000000 - i, "type": "supergroup", "title": f"Group {i}"} for i in range(chats)]
+    sent = {chat["id"]: [] for chat in chat_objects}
+    next_id = {chat["id"]: 1 for chat in chat_objects}
+
+    def text():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randrange(3, 30)))
+
+    for update_id in range(1, updates + 1):
+        chat = rng.choice(chat_objects)
+        chat_id = chat["id"]
+        roll = rng.random()
+
+        if roll < 0.70 or not sent[chat_id]:
+            user = rng.choice(users)
+            message = {"message_id": next_id[chat_id], "date": now, "chat": chat, "from": user, "text": text()}
+            sent[chat_id].append((message["message_id"], user))
+            next_id[chat_id] += 1
+            yield {"update_id": update_id, "message": message}
+        elif roll < 0.85:
+            message_id, user = rng.choice(sent[chat_id][-200:])
+            message = {"message_id": message_id, "date": now, "edit_date": now, "chat": chat, "from": user, "text": text()}
+            yield {"update_id": update_id, "edited_message": message}
+        elif roll < 0.95:
+            message_id, editor = rng.choice(sent[chat_id][-200:])
+            presser = rng.choice(users)
+            notification = {
+                "message_id": 9_000_000 + update_id, "date": now, "chat": chat,
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "Sus Ninja"},
+                "text": "📝 Message Edited by someone"
+            }
+            action = "reveal_edit" if rng.random() < 0.8 else "dismiss_edit"
+            data = susninja.edit_callback_data(action, chat_id, message_id, editor["id"], reveal=rng.random() < 0.7)
+            yield {"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": presser, "chat_instance": str(chat_id),
+                "message": notification, "data": data
+            }}
+        else:
+            joiner = {"id": BOT_ID, "is_bot": True, "first_name": "Sus Ninja"} if rng.random() < 0.1 else rng.choice(users)
+            message = {"message_id": next_id[chat_id], "date": now, "chat": chat, "from": joiner, "new_chat_members": [joiner]}
+            next_id[chat_id] += 1
+            yield {"update_id": update_id, "message": message}
+
+
+def update_kind(update: Update) -> str:
+    if update.callback_query:
+        return "callback"
+    if update.edited_message:
+        return "edit"
+    if update.message and update.message.new_chat_members:
+        return "join"
+    return "message"
+
+
+def percentile(samples: list, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def peak_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(raw_stream, api_latency: float, concurrency: int) -> None:
+    bot = Bot(token=BOT_TOKEN, session=FakeSession(api_latency))
+    susninja.bot = bot
+    await susninja.bot_identity.refresh()
+
+    # Updates are parsed one at a time right before they are fed, so RSS growth is the bot's own
+    baseline_rss = peak_rss_mib()
+    latencies = {}
+    parse_time = 0.0
+    count = 0
+
+    async def feed(update: Update, kind: str) -> None:
+        update_start = time.perf_counter()
+        await susninja.dp.feed_update(bot, update)
+        latencies.setdefault(kind, []).append(time.perf_counter() - update_start)
+
+    in_flight = set()
+    start = time.perf_counter()
+    for raw in raw_stream:
+        parse_start = time.perf_counter()
+        update = Update.model_validate(raw, context={"bot": bot})
+        parse_time += time.perf_counter() - parse_start
+        count += 1
+        if concurrency <= 1:
+            await feed(update, update_kind(update))
+            continue
+        # A task per update like the polling loop and shard workers, ChatOrderingMiddleware keeps each chat in order
+        if len(in_flight) >= concurrency:
+            _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        in_flight.add(asyncio.create_task(feed(update, update_kind(update))))
+    if in_flight:
+        await asyncio.wait(in_flight)
+    elapsed = time.perf_counter() - start - parse_time
+
+    cached = susninja.message_store.total_messages
+    sweep_start = time.perf_counter()
+    expired = susninja.message_store.expire(float("inf"), cached)
+    sweep = time.perf_counter() - sweep_start
+
+    print(f"{count} updates in {elapsed:.2f}s -> {count / elapsed:,.0f} updates/sec, parsing excluded "
+          f"({bot.session.calls} fake API calls, up to {concurrency} in flight)")
+    print(f"{'kind':<10}{'count':>8}{'p50 us':>10}{'p99 us':>10}")
+    for kind, samples in sorted(latencies.items()):
+        print(f"{kind:<10}{len(samples):>8}{percentile(samples, 0.5) * 1e6:>10.1f}{percentile(samples, 0.99) * 1e6:>10.1f}")
+    everything = [sample for samples in latencies.values() for sample in samples]
+    print(f"{'all':<10}{len(everything):>8}{percentile(everything, 0.5) * 1e6:>10.1f}{percentile(everything, 0.99) * 1e6:>10.1f}")
+    print(f"expiry sweep of {expired} cached messages: {sweep * 1000:.2f}ms")
+    peak_rss = peak_rss_mib()
+    print(f"peak RSS: {peak_rss:.1f} MiB, {peak_rss - baseline_rss:.1f} MiB above the {baseline_rss:.1f} MiB baseline before feeding")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="updates in flight at once; above 1 each update runs as its own task")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated seconds per Bot API call")
+    parser.add_argument("--replay", help="JSONL file of raw Update objects to feed instead of a synthetic stream")
+    parser.add_argument("--record", help="write the synthetic stream to this JSONL file and exit")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    susninja.logger.setLevel(getattr(logging, args.log_level))
+    susninja.log_listener.stream = open(os.devnull, "w")
+
+    if args.replay:
+        replay_file = open(args.replay)
+        stream = (json.loads(line) for line in replay_file if line.strip())
+    else:
+        stream = generate_stream(args.updates, args.chats, args.seed)
+
+    if args.record:
+        recorded = 0
+        with open(args.record, "w") as record_file:
+            for raw in stream:
+                record_file.write(json.dumps(raw, ensure_ascii=False) + "\n")
+                recorded += 1
+        print(f"recorded {recorded} updates to {args.record}")
+    else:
+        asyncio.run(run(stream, args.api_latency, args.concurrency))
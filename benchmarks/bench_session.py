@@ -0,0 +1,200 @@
+"""Benchmark: Bot API client sessions against a local mock Bot API server.
+
+Starts an aiohttp server on 127.0.0.1 that answers getMe, sendMessage,
+editMessageText, answerCallbackQuery and getChatAdministrators like Telegram
+would, then pushes the same mixed request load through aiogram's default
+AiohttpSession and through create_api_session() with and without orjson.
+The variants take turns for --rounds rounds and each row reports the median
+round, so warm-up and drift hit every variant alike. Client and server share
+the loop and the CPU, so compare the rows with each other, not with
+production numbers. Run from the repository root:
+
+    python benchmarks/bench_session.py --requests 5000 --concurrency 64 --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("PERSISTENCE_BACKEND", "none")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+import susninja  # noqa: E402
+
+BOT_TOKEN = "123456:TEST-TOKEN"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Sus Ninja", "username": "SusNinjaBot"}
+CHAT = {"id": -1001000000000, "type": "supergroup", "title": "Benchmark Group"}
+ADMINS = 50
+
+
+class MockBotApi:
+    """Answers Bot API calls from memory and counts the connections clients open"""
+
+    def __init__(self):
+        self.requests = 0
+        self.peers = set()
+        self._next_message_id = 1
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.peers.add(request.transport.get_extra_info("peername"))
+        form = await request.post()
+        method = request.match_info["method"]
+
+        if method == "getMe":
+            result = BOT_USER
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(form)
+        elif method == "answerCallbackQuery":
+            result = True
+        elif method == "getChatAdministrators":
+            result = [
+                {"status": "administrator", "user": {"id": 1000 + i, "is_bot": False, "first_name": f"Admin {i}", "username": f"admin_{i}"},
+                 "can_be_edited": False, "is_anonymous": False, "can_manage_chat": True, "can_delete_messages": True,
+                 "can_manage_video_chats": False, "can_restrict_members": True, "can_promote_members": False,
+                 "can_change_info": False, "can_invite_users": True, "can_post_stories": False, "can_edit_stories": False,
+                 "can_delete_stories": False}
+                for i in range(ADMINS)
+            ]
+        else:
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found: method not found"}, status=404)
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, form) -> dict:
+        if "message_id" in form:
+            message_id = int(form["message_id"])
+        else:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        message = {"message_id": message_id, "date": int(time.time()), "chat": CHAT, "from": BOT_USER, "text": form.get("text", "")}
+        if "reply_markup" in form:
+            message["reply_markup"] = json.loads(form["reply_markup"])
+        return message
+
+
+async def start_server(api: MockBotApi) -> tuple:
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def make_calls(count: int, seed: int) -> list:
+    # Roughly what the bot sends: notifications, in-place updates, button answers and admin lookups
+    rng = random.Random(seed)
+    calls = []
+    for index in range(count):
+        roll = rng.random()
+        if roll < 0.55:
+            calls.append(("send_message", dict(
+                chat_id=CHAT["id"], text=f"📝 Message Edited by someone #{index}", parse_mode="HTML",
+                reply_markup=susninja.edit_keyboard(CHAT["id"], index, 1000, revealed=False)
+            )))
+        elif roll < 0.80:
+            calls.append(("edit_message_text", dict(
+                chat_id=CHAT["id"], message_id=index + 1, text=f"📝 Edited again #{index}", parse_mode="HTML",
+                reply_markup=susninja.edit_keyboard(CHAT["id"], index, 1000, revealed=True)
+            )))
+        elif roll < 0.95:
+            calls.append(("answer_callback_query", dict(callback_query_id=str(index), text="👀")))
+        else:
+            calls.append(("get_chat_administrators", dict(chat_id=CHAT["id"])))
+    return calls
+
+
+def percentile(samples: list, fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))] if samples else 0.0
+
+
+async def run_against(session, api: MockBotApi, calls: list, concurrency: int) -> tuple:
+    # (requests per second, {method: latencies}) for one round
+    bot = Bot(token=BOT_TOKEN, session=session)
+    bot.session.middleware(susninja.ApiMetricsMiddleware())
+    await bot.get_me()
+
+    latencies = {}
+    pending = iter(calls)
+
+    async def worker() -> None:
+        for method_name, kwargs in pending:
+            start = time.perf_counter()
+            await getattr(bot, method_name)(**kwargs)
+            latencies.setdefault(method_name, []).append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await bot.session.close()
+    return len(calls) / elapsed, latencies
+
+
+async def main(args) -> None:
+    calls = make_calls(args.requests, args.seed)
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.rounds} rounds, "
+          f"orjson {'installed' if susninja.orjson else 'missing'}")
+
+    sessions = [
+        ("aiogram default", lambda api: AiohttpSession(api=api)),
+        ("tuned, stdlib json", lambda api: susninja.create_api_session(api=api, json_loads=json.loads, json_dumps=json.dumps)),
+    ]
+    if susninja.orjson is not None:
+        sessions.append(("tuned, orjson", lambda api: susninja.create_api_session(api=api)))
+
+    rounds = {name: [] for name, _ in sessions}
+    for _ in range(args.rounds):
+        for name, factory in sessions:
+            api = MockBotApi()
+            runner, base_url = await start_server(api)
+            bot_api = TelegramAPIServer.from_base(base_url)
+            try:
+                rate, latencies = await run_against(factory(bot_api), api, calls, args.concurrency)
+            finally:
+                await runner.cleanup()
+            rounds[name].append((rate, latencies, len(api.peers)))
+
+    print(f"{'session':<22}{'req/s':>10}{'min':>8}{'max':>8}{'p50 ms':>9}{'p99 ms':>9}{'conns':>7}")
+    for name, results in rounds.items():
+        rates = sorted(rate for rate, _, _ in results)
+        _, latencies, peers = sorted(results, key=lambda result: result[0])[len(results) // 2]
+        everything = [sample for samples in latencies.values() for sample in samples]
+        print(f"{name:<22}{rates[len(rates) // 2]:>10,.0f}{rates[0]:>8,.0f}{rates[-1]:>8,.0f}"
+              f"{percentile(everything, 0.5) * 1e3:>9.2f}{percentile(everything, 0.99) * 1e3:>9.2f}{peers:>7}")
+
+    # Per-method latency of each session's median round
+    print(f"\n{'session / method':<32}{'calls':>7}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, results in rounds.items():
+        _, latencies, _ = sorted(results, key=lambda result: result[0])[len(results) // 2]
+        print(name)
+        for method_name, samples in sorted(latencies.items()):
+            print(f"  {method_name:<30}{len(samples):>7}{percentile(samples, 0.5) * 1e3:>9.2f}{percentile(samples, 0.99) * 1e3:>9.2f}")
+
+    # Per-method latency as exported on /metrics by ApiMetricsMiddleware, summed over every run
+    print("\nsusninja_api_latency_seconds:")
+    for line in susninja.API_LATENCY.render():
+        if line.startswith("susninja_api_latency_seconds_count") or line.startswith("susninja_api_latency_seconds_sum"):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    susninja.log_listener.stream = open(os.devnull, "w")
+    asyncio.run(main(args))
@@ -0,0 +1,101 @@
+"""Benchmark: the synthetic update stream pushed through 1..N worker processes over local pipes.
+
+Each worker gets the fake Bot API session from bench_pipeline, so nothing
+touches the network. Startup and shutdown cost is measured with an empty
+run and subtracted. Every worker records the order updates reached its
+handlers, and a run fails unless each update was handled exactly once and
+every chat's updates were handled in the order they were submitted. Run from
+the repository root:
+
+    python benchmarks/bench_sharding.py --updates 20000 --workers 1 2 4
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+os.environ.setdefault("PERSISTENCE_BACKEND", "none")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+# The fake session has no flood limits, pacing would only measure the sleeps
+os.environ.setdefault("OUTBOUND_SCHEDULER", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram.types import Update  # noqa: E402
+
+import susninja  # noqa: E402
+from bench_pipeline import FakeSession, generate_stream  # noqa: E402
+
+
+class RecordingSession(FakeSession):
+    """FakeSession that notes (chat key, update_id) as each update reaches the handlers and saves the list on close"""
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.path = os.path.join(directory, f"{os.getpid()}.json")
+        self.handled = []
+        # Registered after ChatOrderingMiddleware, so it sees updates once they hold their chat's turn
+        susninja.dp.update.outer_middleware(self._record)
+
+    async def _record(self, handler, event, data):
+        self.handled.append((susninja.update_shard_key(event), event.update_id))
+        return await handler(event, data)
+
+    async def close(self):
+        with open(self.path, "w") as f:
+            json.dump(self.handled, f)
+
+
+def check(directory: str, updates: list) -> None:
+    handled = []
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name)) as f:
+            handled.extend(json.load(f))
+    ids = sorted(update_id for _, update_id in handled)
+    assert ids == [update.update_id for update in updates], f"{len(ids)} of {len(updates)} updates handled, or some twice"
+
+    order = defaultdict(list)
+    for key, update_id in handled:
+        order[key].append(update_id)
+    submitted = defaultdict(list)
+    for update in updates:
+        submitted[susninja.update_shard_key(update)].append(update.update_id)
+    for key, update_ids in order.items():
+        assert update_ids == submitted[key], f"chat {key} handled out of order"
+
+
+def run(workers: int, updates: list) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        pool = susninja.ShardPool(workers, session_factory=functools.partial(RecordingSession, directory))
+        start = time.perf_counter()
+        pool.start()
+        for update in updates:
+            pool.submit(update, block=True)
+        pool.stop(timeout=600)
+        elapsed = time.perf_counter() - start
+        check(directory, updates)
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    susninja.log_listener.stream = open(os.devnull, "w")
+    updates = [Update.model_validate(raw) for raw in generate_stream(args.updates, args.chats, 1)]
+    print(f"{len(updates)} updates across {args.chats} chats, {os.cpu_count()} CPUs")
+
+    for workers in args.workers:
+        overhead = run(workers, [])
+        elapsed = run(workers, updates)
+        busy = max(elapsed - overhead, 1e-9)
+        print(f"{workers:>2} workers  {elapsed:6.2f}s total, {overhead:5.2f}s start/stop  "
+              f"-> {len(updates) / busy:8,.0f} updates/sec")
@@ -1,25 +1,68 @@
 import os
 import sys
 import time
+import heapq
+import itertools
+import operator
+import math
+import hmac
+import base64
+import hashlib
+import re
+import difflib
+import html
+import bisect
+import json
+import queue
 import random
+import atexit
 import logging
+import logging.handlers
+import sqlite3
+import signal
+import multiprocessing
 import threading
 import weakref
 import asyncio
+import contextvars
 import concurrent.futures
-from collections import defaultdict, deque
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Set
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from aiogram import Bot, Dispatcher, F, types
-from aiogram.filters import Command
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.filters import Command, CommandObject
+from aiogram.methods import (
+    CopyMessage,
+    DeleteMessage,
+    DeleteMessages,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    ForwardMessages,
+    SendMessage,
+    SendPhoto
+)
 from aiogram.types import (
     BotCommand,
+    ChatMemberUpdated,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
-    Message
+    Message,
+    Update
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Environment variables and config
 BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
@@ -27,12 +70,85 @@ CHANNEL_URL = "https://t.me/WorkGlows"
 GROUP_URL = "https://t.me/SoulMeetsHQ"
 OWNER_ID = 5290407067
 PORT = int(os.environ.get("PORT", 10000))
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "color")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Key for signing inline button data, derived from the bot token when unset
+CALLBACK_SECRET = os.getenv("CALLBACK_SECRET", "")
+# Seconds during which further edits of a message are folded into one notification update
+EDIT_DEBOUNCE_WINDOW = float(os.getenv("EDIT_DEBOUNCE_WINDOW", "10"))
+# Versions kept per edited message, the latest text included; older ones fall off the chain
+EDIT_HISTORY_MAX_VERSIONS = max(2, int(os.getenv("EDIT_HISTORY_MAX_VERSIONS", "10")))
+PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "sqlite")
+DATABASE_PATH = os.getenv("DATABASE_PATH", "susninja.db")
+# Private channel the bot can post in, used to probe for deleted messages; detection is off if unset
+DELETION_PROBE_CHAT_ID = int(os.getenv("DELETION_PROBE_CHAT_ID", "0")) or None
+# Worker processes sharing the chats by chat.id; 1 keeps everything in this process
+WORKER_PROCESSES = max(1, int(os.getenv("WORKER_PROCESSES", "1")))
+# Base URL of a local Bot API server, e.g. http://localhost:8081; empty uses api.telegram.org
+BOT_API_URL = os.getenv("BOT_API_URL", "")
+# Size the Bot API connection pool for our concurrency, set a request timeout and use orjson when installed; 0 keeps aiogram's defaults
+API_SESSION_TUNING = os.getenv("API_SESSION_TUNING", "1") == "1"
+# Pace sends behind Telegram's flood limits; 0 when a local Bot API server or a fake session needs no pacing
+OUTBOUND_SCHEDULER = os.getenv("OUTBOUND_SCHEDULER", "1") == "1"
+# Upload every IMAGES entry to the owner chat at startup so the first /start is already served by file_id
+PREWARM_PHOTOS = os.getenv("PREWARM_PHOTOS", "0") == "1"
 
 # Performance configurations
 MAX_MESSAGES_PER_CHAT = 1000
 MESSAGE_TTL = 3600
 CLEANUP_INTERVAL = 300
 MAX_MESSAGE_LENGTH = 4096
+EXPIRY_TICK_INTERVAL = 1.0
+EXPIRY_BATCH_SIZE = 500
+EXPIRY_TICK_BUDGET = 0.003
+CACHE_HIGH_WATER_BYTES = 64 * 1024 * 1024
+CACHE_LOW_WATER_BYTES = 48 * 1024 * 1024
+MESSAGE_RECORD_OVERHEAD = 256
+EDIT_CACHE_MAX_ENTRIES = 5000
+EDIT_CACHE_TTL = 86400
+CALLBACK_SIGNATURE_BYTES = 8
+CALLBACK_ROUTE_RATE = 0.5
+CALLBACK_ROUTE_BURST = 3
+BOT_IDENTITY_REFRESH_INTERVAL = 3600
+BROADCAST_WORKERS = 16
+BROADCAST_GLOBAL_RATE = 30
+BROADCAST_PER_CHAT_RATE = 1
+BROADCAST_MAX_RETRIES = 3
+BROADCAST_PROGRESS_INTERVAL = 5
+PERSIST_BATCH_SIZE = 500
+PERSIST_FLUSH_INTERVAL = 1.0
+ADMIN_CACHE_TTL = 600
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+LOOP_LAG_INTERVAL = 0.5
+DELETION_WINDOW = 256
+DELETION_PROBE_INTERVAL = 60
+DELETION_PROBE_BATCH = 100
+DELETION_PROBE_BUDGET = 30
+DELETION_PROBE_RATE = 1
+PHOTO_PREWARM_INTERVAL = 1.0
+# Bad Request descriptions that mean the cached file_id itself is unusable, anything else is not a cache miss
+PHOTO_FILE_ID_ERRORS = ("file identifier", "file_id", "file reference", "type of file mismatch")
+SHARD_STOP_TIMEOUT = 10
+SHARD_OUTBOX_LIMIT = 10000
+SHARD_HEALTH_INTERVAL = 1.0
+SHARD_RESTART_LIMIT = 3
+SHARD_RESTART_WINDOW = 60
+UPDATE_CONCURRENCY = 64
+OUTBOUND_GLOBAL_RATE = 30
+OUTBOUND_GROUP_RATE = 20 / 60
+OUTBOUND_GROUP_BURST = 5
+OUTBOUND_PRIVATE_RATE = 1
+OUTBOUND_PRIVATE_BURST = 3
+OUTBOUND_CHAT_QUEUE_LIMIT = 20
+OUTBOUND_MAX_RETRIES = 2
+OUTBOUND_MAX_RETRY_AFTER = 30
+API_CONNECTION_LIMIT = UPDATE_CONCURRENCY + BROADCAST_WORKERS
+API_REQUEST_TIMEOUT = 30
 
 # Bot data structures
 broadcast_mode = set()
@@ -41,10 +157,518 @@ user_ids = set()
 group_ids = set()
 
 # Message cache data structures
-messages: Dict[int, Dict[int, dict]] = defaultdict(dict)
-chat_queues: Dict[int, deque] = defaultdict(lambda: deque(maxlen=MAX_MESSAGES_PER_CHAT))
-recent_message_ids: Dict[int, Set[int]] = defaultdict(set)
-last_cleanup = time.time()
+class UserNames:
+    """Name fields shared by every cached message from the same user"""
+    __slots__ = ('username', 'first_name', 'last_name')
+
+    def __init__(self, username: Optional[str], first_name: Optional[str], last_name: Optional[str]):
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+class UserTable:
+    """Per-process user table so name strings are stored once per user, not per message"""
+
+    def __init__(self):
+        self._users: Dict[int, UserNames] = {}
+        # Users whose names changed since the last persistence flush
+        self.dirty: Set[int] = set()
+
+    def remember(self, user) -> Optional[int]:
+        # Record the latest names for a Telegram user, returns the user id
+        if user is None:
+            return None
+        names = self._users.get(user.id)
+        if names is None:
+            self._users[user.id] = UserNames(user.username, user.first_name, user.last_name)
+            self.dirty.add(user.id)
+        elif (names.username, names.first_name, names.last_name) != (user.username, user.first_name, user.last_name):
+            names.username = user.username
+            names.first_name = user.first_name
+            names.last_name = user.last_name
+            self.dirty.add(user.id)
+        return user.id
+
+    def load(self, user_id: int, username: Optional[str], first_name: Optional[str], last_name: Optional[str]) -> None:
+        self._users[user_id] = UserNames(username, first_name, last_name)
+
+    def get(self, user_id: Optional[int]) -> Optional[UserNames]:
+        return self._users.get(user_id) if user_id is not None else None
+
+    def forget(self, user_id: int) -> None:
+        # No cached message refers to the user any more, their names go with the last one
+        if self._users.pop(user_id, None) is not None:
+            self.dirty.discard(user_id)
+            persistence.enqueue('delete_user_names', (user_id,))
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+class CachedMessage:
+    """Compact cached message record, timestamps are whole seconds"""
+    __slots__ = ('message_id', 'text', 'user_id', 'timestamp', 'date', 'reply_to_message_id')
+
+    def __init__(self, message_id: int, text: str, user_id: Optional[int], timestamp: int,
+                 date: int, reply_to_message_id: Optional[int]):
+        self.message_id = message_id
+        self.text = text
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.date = date
+        self.reply_to_message_id = reply_to_message_id
+
+class MessageStore:
+    """Per-chat message cache keeping insertion order with O(1) add, remove and eviction"""
+
+    def __init__(self, max_per_chat: int = MAX_MESSAGES_PER_CHAT):
+        self.max_per_chat = max_per_chat
+        self._chats: Dict[int, OrderedDict] = {}
+        # Expiry index: min-heap of (oldest timestamp, chat_id), one live entry per chat
+        self._expiry_heap: list = []
+        self._scheduled: Dict[int, float] = {}
+        # Maintained counters, kept in sync on every mutation
+        self.total_messages = 0
+        self.total_bytes = 0
+        self._chat_bytes: Dict[int, int] = {}
+        # Cached messages per author, and authors whose last cached message has gone since the last sweep
+        self._user_refs: Dict[int, int] = {}
+        self._released_users: Set[int] = set()
+
+    @staticmethod
+    def record_size(msg_data: CachedMessage) -> int:
+        # Approximate resident size of a cached record
+        return MESSAGE_RECORD_OVERHEAD + sys.getsizeof(msg_data.text)
+
+    def add(self, chat_id: int, message_id: int, msg_data: CachedMessage) -> Optional[int]:
+        # Insert or refresh a message, returns the evicted message id if the chat was full
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = OrderedDict()
+            self._chat_bytes[chat_id] = 0
+
+        evicted_id = None
+        previous = chat.get(message_id)
+        if previous is not None:
+            chat.move_to_end(message_id)
+            self._account(chat_id, -1, -self.record_size(previous))
+            self._release_user(previous.user_id)
+        elif len(chat) >= self.max_per_chat:
+            evicted_id, evicted = chat.popitem(last=False)
+            self._account(chat_id, -1, -self.record_size(evicted))
+            self._release_user(evicted.user_id)
+
+        chat[message_id] = msg_data
+        self._account(chat_id, 1, self.record_size(msg_data))
+        if msg_data.user_id is not None:
+            self._user_refs[msg_data.user_id] = self._user_refs.get(msg_data.user_id, 0) + 1
+        if chat_id not in self._scheduled:
+            self._schedule(chat_id, msg_data.timestamp)
+        return evicted_id
+
+    def get(self, chat_id: int, message_id: int) -> Optional[CachedMessage]:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return None
+        return chat.get(message_id)
+
+    def remove(self, chat_id: int, message_id: int) -> Optional[CachedMessage]:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return None
+        msg_data = chat.pop(message_id, None)
+        if msg_data is not None:
+            self._account(chat_id, -1, -self.record_size(msg_data))
+            self._release_user(msg_data.user_id)
+        if not chat:
+            self._drop_chat(chat_id)
+        return msg_data
+
+    def has_expired(self, cutoff: float) -> bool:
+        # O(1) peek; may report a superseded entry, which expire() then skips
+        return bool(self._expiry_heap) and self._expiry_heap[0][0] < cutoff
+
+    def expire(self, cutoff: float, max_items: int) -> int:
+        # Remove up to max_items messages older than cutoff, visiting only chats that are due
+        return self._evict_oldest(max_items, cutoff=cutoff)
+
+    def shrink(self, target_bytes: int, max_items: int, evicted: Optional[list] = None) -> int:
+        # Evict the globally oldest messages until the cache fits in target_bytes, collecting their keys in evicted
+        return self._evict_oldest(max_items, target_bytes=target_bytes, evicted=evicted)
+
+    def _evict_oldest(self, max_items: int, cutoff: float = float('inf'), target_bytes: int = -1,
+                      evicted: Optional[list] = None) -> int:
+        heap = self._expiry_heap
+        removed = 0
+
+        while heap and removed < max_items and heap[0][0] < cutoff and self.total_bytes > target_bytes:
+            scheduled_at, chat_id = heapq.heappop(heap)
+            if self._scheduled.get(chat_id) != scheduled_at:
+                continue  # Superseded entry
+            del self._scheduled[chat_id]
+
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                continue
+
+            # Entries are ordered by insertion time, so only the expired head is visited
+            while chat and removed < max_items and self.total_bytes > target_bytes:
+                head_data = chat[next(iter(chat))]
+                if head_data.timestamp >= cutoff:
+                    break
+                chat.popitem(last=False)
+                self._account(chat_id, -1, -self.record_size(head_data))
+                self._release_user(head_data.user_id)
+                removed += 1
+                if evicted is not None:
+                    evicted.append((chat_id, head_data.message_id))
+                if target_bytes >= 0:
+                    break  # Shrinking walks chats oldest-first one message at a time
+
+            if chat:
+                # Head may be newer than the heap entry after removals, reschedule on the real head
+                self._schedule(chat_id, chat[next(iter(chat))].timestamp)
+            else:
+                self._drop_chat(chat_id)
+
+        return removed
+
+    def _schedule(self, chat_id: int, timestamp: float) -> None:
+        self._scheduled[chat_id] = timestamp
+        heapq.heappush(self._expiry_heap, (timestamp, chat_id))
+
+    def _account(self, chat_id: int, count: int, size: int) -> None:
+        self.total_messages += count
+        self.total_bytes += size
+        self._chat_bytes[chat_id] += size
+
+    def _drop_chat(self, chat_id: int) -> None:
+        del self._chats[chat_id]
+        del self._chat_bytes[chat_id]
+
+    def _release_user(self, user_id: Optional[int]) -> None:
+        if user_id is None:
+            return
+        refs = self._user_refs[user_id] - 1
+        if refs:
+            self._user_refs[user_id] = refs
+        else:
+            del self._user_refs[user_id]
+            self._released_users.add(user_id)
+
+    def refers_to(self, user_id: int) -> bool:
+        return user_id in self._user_refs
+
+    def take_released_users(self) -> list:
+        # Authors with no cached message left, skipping any who posted again since they were released
+        released = [user_id for user_id in self._released_users if user_id not in self._user_refs]
+        self._released_users.clear()
+        return released
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+    def chat_ids(self) -> list:
+        return list(self._chats)
+
+    def chat_size(self, chat_id: int) -> int:
+        chat = self._chats.get(chat_id)
+        return len(chat) if chat is not None else 0
+
+    def chat_bytes(self, chat_id: int) -> int:
+        return self._chat_bytes.get(chat_id, 0)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def __len__(self) -> int:
+        return self.total_messages
+
+class RecentIdWindow:
+    """Sliding bitmap over one chat's message ids, bit i stands for message base + i"""
+    __slots__ = ('base', 'bits')
+
+    def __init__(self, base: int):
+        self.base = base
+        self.bits = 0
+
+    def mark(self, message_id: int, size: int) -> None:
+        offset = message_id - self.base
+        if offset < 0:
+            return  # Already slid past it
+        if offset >= size:
+            shift = offset - size + 1
+            self.bits >>= shift
+            self.base += shift
+            offset = size - 1
+        self.bits |= 1 << offset
+
+    def clear(self, message_id: int) -> None:
+        offset = message_id - self.base
+        if offset >= 0:
+            self.bits &= ~(1 << offset)
+
+    def ids(self) -> list:
+        # Set bits in ascending order, O(window) regardless of chat size
+        result = []
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            result.append(self.base + lowest.bit_length() - 1)
+            bits ^= lowest
+        return result
+
+class DeletionTracker:
+    """Recently seen message ids per chat, the candidates for deletion probing"""
+
+    def __init__(self, window: int = DELETION_WINDOW):
+        self.window = window
+        self._windows: Dict[int, RecentIdWindow] = {}
+        # Chats whose messages cannot be forwarded (protected content), never probed again
+        self.unprobeable: Set[int] = set()
+        # Highest id probed so far per chat, anything above it has never been probed
+        self._probed_upto: Dict[int, int] = {}
+
+    def mark(self, chat_id: int, message_id: int) -> None:
+        window = self._windows.get(chat_id)
+        if window is None:
+            window = self._windows[chat_id] = RecentIdWindow(max(1, message_id - self.window + 1))
+        window.mark(message_id, self.window)
+
+    def discard(self, chat_id: int, message_id: int) -> None:
+        window = self._windows.get(chat_id)
+        if window is not None:
+            window.clear(message_id)
+
+    def candidates(self, chat_id: int, store: MessageStore, fresh_only: bool = False) -> list:
+        # Ids still cached in the store, anything else is dropped from the window
+        window = self._windows.get(chat_id)
+        if window is None:
+            return []
+        since = self._probed_upto.get(chat_id, 0) if fresh_only else 0
+        cached = []
+        for message_id in window.ids():
+            if store.get(chat_id, message_id) is None:
+                window.clear(message_id)
+            elif message_id > since:
+                cached.append(message_id)
+        if not window.bits:
+            self.forget(chat_id)
+        return cached
+
+    def mark_probed(self, chat_id: int, message_id: int) -> None:
+        if chat_id in self._windows and message_id > self._probed_upto.get(chat_id, 0):
+            self._probed_upto[chat_id] = message_id
+
+    def has_fresh(self, chat_id: int) -> bool:
+        window = self._windows.get(chat_id)
+        return window is not None and window.bits.bit_length() + window.base - 1 > self._probed_upto.get(chat_id, 0)
+
+    def forget(self, chat_id: int) -> None:
+        self._windows.pop(chat_id, None)
+        self._probed_upto.pop(chat_id, None)
+
+    def chat_ids(self) -> list:
+        return [chat_id for chat_id in self._windows if chat_id not in self.unprobeable]
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+user_table = UserTable()
+message_store = MessageStore()
+deletion_tracker = DeletionTracker()
+
+# Edit details cache data structures
+WORD_TOKEN = re.compile(r'\S+\s*|\s+')
+
+def tokenize(text: str) -> list:
+    # Words with their trailing whitespace, so joining the tokens gives the text back exactly
+    return WORD_TOKEN.findall(text) if text else []
+
+def make_delta(newer: list, older: list) -> tuple:
+    # Reverse delta: only the changed spans, as (start, end, older tokens) against the newer token list
+    # Typo fixes touch a few words, so the common head and tail are skipped before the quadratic matcher runs
+    limit = min(len(newer), len(older))
+    head = 0
+    while head < limit and newer[head] == older[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and newer[-1 - tail] == older[-1 - tail]:
+        tail += 1
+
+    matcher = difflib.SequenceMatcher(None, newer[head:len(newer) - tail], older[head:len(older) - tail], autojunk=False)
+    return tuple(
+        (head + i1, head + i2, tuple(older[head + j1:head + j2]))
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal'
+    )
+
+def apply_delta(tokens: list, delta: tuple) -> list:
+    tokens = list(tokens)
+    for start, end, replacement in reversed(delta):
+        tokens[start:end] = replacement
+    return tokens
+
+class EditHistory:
+    """Version chain of one edited message: the latest text plus word-level reverse deltas to older versions"""
+    __slots__ = ('latest', 'deltas', 'edits', 'editor_id', 'editor_mention', 'notification_id', 'reveal_cache', 'touched')
+
+    def __init__(self, original: str, editor_id: int, editor_mention: str):
+        self.latest = original
+        # Oldest first, deltas[-1] turns the latest text into the one before it
+        self.deltas: list = []
+        self.edits = 0
+        self.editor_id = editor_id
+        self.editor_mention = editor_mention
+        self.notification_id: Optional[int] = None
+        # (edits, rendered diff body) so repeated reveals of the same edit skip rendering
+        self.reveal_cache: Optional[tuple] = None
+        self.touched = time.time()
+
+    def add_version(self, text: str) -> None:
+        self.deltas.append(make_delta(tokenize(text), tokenize(self.latest)))
+        self.latest = text
+        self.edits += 1
+        if len(self.deltas) >= EDIT_HISTORY_MAX_VERSIONS:
+            del self.deltas[0]  # Oldest version falls off the chain
+
+    def steps(self):
+        # (edit number, tokens after the edit, delta back to before it), newest edit first
+        tokens = tokenize(self.latest)
+        number = self.edits
+        for delta in reversed(self.deltas):
+            yield number, tokens, delta
+            tokens = apply_delta(tokens, delta)
+            number -= 1
+
+class EditDataCache:
+    """LRU of edit histories keyed by (chat_id, message_id), bounded by size and idle age"""
+
+    def __init__(self, max_entries: int = EDIT_CACHE_MAX_ENTRIES, ttl: float = EDIT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[EditHistory]:
+        record = self._entries.get(key)
+        if record is None:
+            self.misses += 1
+            return None
+
+        now = time.time()
+        if now - record.touched > self.ttl:
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return None
+
+        record.touched = now
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return record
+
+    def put(self, key: tuple, record: EditHistory) -> None:
+        self._entries[key] = record
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: tuple) -> Optional[EditHistory]:
+        return self._entries.pop(key, None)
+
+    def expire(self, max_items: int) -> int:
+        # Least recently used entries sit at the head, so only idle ones are visited
+        cutoff = time.time() - self.ttl
+        removed = 0
+        while self._entries and removed < max_items:
+            oldest_key = next(iter(self._entries))
+            if self._entries[oldest_key].touched >= cutoff:
+                break
+            del self._entries[oldest_key]
+            removed += 1
+        self.evictions += removed
+        return removed
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Rate limiting
+class TokenBucket:
+    """Async token bucket refilling rate tokens per second up to capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def try_acquire(self) -> float:
+        # Take a token if one is available, otherwise return the seconds to wait
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        # Honour a RetryAfter: no tokens until the flood wait is over
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    @property
+    def idle(self) -> bool:
+        now = time.monotonic()
+        return now >= self._paused_until and self._tokens + (now - self._updated) * self.rate >= self.capacity
+
+class ChatRateLimiter:
+    """Per-chat token buckets created on demand and pruned once they are idle"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, prune_threshold: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.prune_threshold = prune_threshold
+        self._buckets: Dict[int, TokenBucket] = {}
+
+    def bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.prune_threshold:
+                self.prune()
+            bucket = self._buckets[chat_id] = TokenBucket(self.rate, self.capacity)
+        return bucket
+
+    async def acquire(self, chat_id: int) -> None:
+        await self.bucket(chat_id).acquire()
+
+    def pause(self, chat_id: int, seconds: float) -> None:
+        self.bucket(chat_id).pause(seconds)
+
+    def prune(self) -> None:
+        # Full buckets carry no state, so dropping them is lossless
+        for chat_id in [chat_id for chat_id, bucket in self._buckets.items() if bucket.idle]:
+            del self._buckets[chat_id]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
 
 # Bot messages
 WELCOME_MSG = """
@@ -182,29 +806,129 @@ class ColoredFormatter(logging.Formatter):
 
         return colored_format
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for machine ingestion"""
+
+    CONTEXT_FIELDS = ('user_id', 'chat_id', 'chat_type')
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in self.CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class DropOldestQueue(queue.Queue):
+    """Bounded queue that discards the oldest record instead of blocking the producer"""
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                self._get()
+                self.dropped += 1
+                self.unfinished_tasks -= 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that enqueues the record as is, so message and traceback formatting happen on the listener"""
+
+    def prepare(self, record):
+        # The stock prepare() formats on the emitting thread and folds exc_info into msg; the queue never
+        # leaves this process, so the args and exc_info can travel untouched
+        return record
+
+class BatchingLogListener(threading.Thread):
+    """Background thread that formats queued records and writes them in batches"""
+
+    def __init__(self, log_queue: queue.Queue, formatter: logging.Formatter, stream=None):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = log_queue
+        self.formatter = formatter
+        self.stream = stream or sys.stderr
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+
+            # Drain whatever else is waiting so one write and flush covers the whole batch
+            batch = [record]
+            stop = False
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+
+            try:
+                self.stream.write("".join(self.formatter.format(item) + "\n" for item in batch))
+                self.stream.flush()
+            except Exception:
+                pass  # Logging must never take the bot down
+            if stop:
+                return
+
+    def stop(self):
+        # Unbounded wait for the sentinel so buffered records reach the stream on shutdown
+        with self.queue.mutex:
+            self.queue._put(None)
+            self.queue.unfinished_tasks += 1
+            self.queue.not_empty.notify()
+        self.join(timeout=5)
+
 # Configure logging with colors
 def setup_colored_logging():
-    """Setup colored logging configuration"""
+    """Setup logging through an off-loop queue, colored by default or JSON lines with LOG_FORMAT=json"""
+    global log_queue, log_listener
     logger = logging.getLogger(__name__)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
 
     # Remove existing handlers
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
 
-    # Create console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        # Create colored formatter with enhanced format
+        formatter = ColoredFormatter(
+            fmt='%(asctime)s - %(name)s - [%(levelname)s] - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
 
-    # Create colored formatter with enhanced format
-    formatter = ColoredFormatter(
-        fmt='%(asctime)s - %(name)s - [%(levelname)s] - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    console_handler.setFormatter(formatter)
+    # The event loop only enqueues, formatting and stdout writes happen on the listener thread
+    log_queue = DropOldestQueue(LOG_QUEUE_SIZE)
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.setLevel(logging.DEBUG)
+    logger.addHandler(queue_handler)
 
-    # Add handler to logger
-    logger.addHandler(console_handler)
+    log_listener = BatchingLogListener(log_queue, formatter)
+    log_listener.start()
+    atexit.register(log_listener.stop)
 
     return logger
 
@@ -212,228 +936,1652 @@ def setup_colored_logging():
 logger = setup_colored_logging()
 
 # Now log the configuration after logger is set up
-logger.info(f"🔧 Configuration loaded - Port: {PORT}, Owner ID: {OWNER_ID}")
-logger.info(f"⚙️ Performance config - Max messages: {MAX_MESSAGES_PER_CHAT}, TTL: {MESSAGE_TTL}s, Cleanup: {CLEANUP_INTERVAL}s")
+logger.info("🔧 Configuration loaded - Port: %s, Owner ID: %s", PORT, OWNER_ID)
+logger.info("⚙️ Performance config - Max messages: %s, TTL: %ss, Cleanup: %ss", MAX_MESSAGES_PER_CHAT, MESSAGE_TTL, CLEANUP_INTERVAL)
 logger.info("🗄️ Data structures initialized")
 logger.info("📝 Bot messages and commands configured")
 
+# Metrics
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Counter:
+    """Prometheus-style counter, label values are passed positionally; safe to increment from any thread"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        # Shard sender threads count drops and restarts while the loop thread renders
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Gauge:
+    """Gauge read from a callback at scrape time, so hot paths never update it"""
+
+    def __init__(self, name: str, documentation: str, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+class Histogram:
+    """Prometheus-style histogram with fixed buckets"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        # Series layout: per-bucket counts, then +Inf count, then sum
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                bucket_labels = format_labels(self.labelnames + ('le',), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            plain_labels = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain_labels} {series[-1]}")
+            lines.append(f"{self.name}_count{plain_labels} {cumulative}")
+        return lines
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+class ChatLatencyTracker:
+    """Handler seconds per chat over the current stats window, only the top chats are exported"""
+
+    def __init__(self, top: int = 10):
+        self.top = top
+        self._seconds: Dict[int, float] = {}
+
+    def add(self, chat_id: int, seconds: float) -> None:
+        self._seconds[chat_id] = self._seconds.get(chat_id, 0.0) + seconds
+
+    def reset(self) -> None:
+        self._seconds = {}
+
+    def render(self) -> list:
+        name = "susninja_chat_handler_seconds"
+        lines = [
+            f"# HELP {name} Handler seconds spent per chat in the current stats window (top {self.top})",
+            f"# TYPE {name} gauge",
+        ]
+        for chat_id, seconds in heapq.nlargest(self.top, self._seconds.items(), key=lambda item: item[1]):
+            lines.append(f'{name}{{chat_id="{chat_id}"}} {seconds}')
+        return lines
+
+UPDATES_TOTAL = Counter("susninja_updates_total", "Updates received by type", ("type",))
+EDITS_DETECTED = Counter("susninja_edits_detected_total", "Edits with changed text in groups")
+NOTIFICATIONS_SENT = Counter("susninja_notifications_sent_total", "Notifications delivered to chats", ("kind",))
+CACHE_REQUESTS = Counter("susninja_cache_requests_total", "Message cache lookups", ("result",))
+HANDLER_LATENCY = Histogram("susninja_handler_latency_seconds", "Handler latency", ("handler",))
+API_LATENCY = Histogram("susninja_api_latency_seconds", "Bot API request latency", ("method",))
+API_ERRORS = Counter("susninja_api_errors_total", "Failed Bot API requests", ("method",))
+LOOP_LAG = Histogram("susninja_event_loop_lag_seconds", "Event loop scheduling lag")
+DELETIONS_DETECTED = Counter("susninja_deletions_detected_total", "Cached group messages found deleted by probing")
+CALLBACK_LATENCY = Histogram("susninja_callback_latency_seconds", "Callback query handling latency by route", ("route",))
+CALLBACK_THROTTLED = Counter("susninja_callbacks_throttled_total", "Callback presses refused by the route rate limit", ("route",))
+EDIT_CALLS_SAVED = Counter("susninja_edit_notification_calls_saved_total", "Edit notification API calls avoided by debouncing")
+CHAT_QUEUE_WAIT = Histogram("susninja_chat_queue_wait_seconds", "Time an update waited behind earlier updates of its chat")
+SHARD_UPDATES = Counter("susninja_shard_updates_total", "Updates forwarded to each worker process", ("shard",))
+SHARD_DROPPED = Counter("susninja_shard_updates_dropped_total", "Updates dropped because their worker was backed up or down", ("shard",))
+SHARD_RESTARTS = Counter("susninja_shard_restarts_total", "Worker processes respawned after dying", ("shard",))
+PHOTO_SENDS = Counter("susninja_photo_sends_total", "Photos sent by source: cached file_id, URL, or URL after a rejected file_id", ("source",))
+DELETION_PROBES = Counter("susninja_deletion_probes_total", "forwardMessages calls made to probe for deletions")
+OUTBOUND_WAIT = Histogram("susninja_outbound_wait_seconds", "Time a Bot API send waited for its chat turn and rate limit tokens", ("priority",))
+OUTBOUND_RETRIES = Counter("susninja_outbound_retries_total", "Bot API sends retried after a flood wait", ("method",))
+OUTBOUND_MERGED = Counter("susninja_outbound_merged_total", "Queued message edits superseded by a newer edit of the same message")
+OUTBOUND_DROPPED = Counter("susninja_outbound_dropped_total", "Group sends dropped because the chat's outbound queue was too deep", ("method",))
+chat_latency = ChatLatencyTracker()
+
+METRICS = [UPDATES_TOTAL, EDITS_DETECTED, NOTIFICATIONS_SENT, CACHE_REQUESTS, HANDLER_LATENCY, API_LATENCY, API_ERRORS, LOOP_LAG,
+           CALLBACK_LATENCY, CALLBACK_THROTTLED, EDIT_CALLS_SAVED, CHAT_QUEUE_WAIT, SHARD_UPDATES, SHARD_DROPPED,
+           SHARD_RESTARTS, PHOTO_SENDS,
+           DELETIONS_DETECTED, DELETION_PROBES, OUTBOUND_WAIT, OUTBOUND_RETRIES, OUTBOUND_MERGED, OUTBOUND_DROPPED]
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(chat_latency.render())
+    return "\n".join(lines) + "\n"
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware counting updates by type"""
+
+    async def __call__(self, handler, event: types.Update, data: dict):
+        UPDATES_TOTAL.inc(event.event_type)
+        return await handler(event, data)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner observer middleware timing the matched handler and charging its chat"""
+
+    async def __call__(self, handler, event, data: dict):
+        start_time = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            handler_object = data.get("handler")
+            HANDLER_LATENCY.observe(elapsed, handler_object.callback.__name__ if handler_object else "unknown")
+            chat = data.get("event_chat")
+            if chat is not None:
+                chat_latency.add(chat.id, elapsed)
+
+class ChatOrderingMiddleware(BaseMiddleware):
+    """Outer update middleware running each chat's updates one at a time in arrival order, under a global cap"""
+
+    def __init__(self, max_concurrency: int = UPDATE_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # Chats with an update in flight, mapped to the updates queued behind it
+        self._queues: Dict[int, deque] = {}
+        self.waiting = 0
+        self.running = 0
+
+    async def __call__(self, handler, event: types.Update, data: dict):
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat is not None else (user.id if user is not None else 0)
+
+        waiters = self._queues.get(key)
+        if waiters is None:
+            self._queues[key] = deque()
+        else:
+            turn = asyncio.get_running_loop().create_future()
+            waiters.append(turn)
+            self.waiting += 1
+            queued_at = time.perf_counter()
+            try:
+                await turn
+            except asyncio.CancelledError:
+                if turn.done() and not turn.cancelled():
+                    self._release(key)  # The chat was already handed to us, pass it on
+                raise
+            finally:
+                self.waiting -= 1
+            CHAT_QUEUE_WAIT.observe(time.perf_counter() - queued_at)
+
+        try:
+            async with self._slots:
+                self.running += 1
+                try:
+                    return await handler(event, data)
+                finally:
+                    self.running -= 1
+        finally:
+            self._release(key)
+
+    def _release(self, key: int) -> None:
+        # Wake the chat's next live waiter, or forget the chat once nothing is queued
+        waiters = self._queues[key]
+        while waiters:
+            turn = waiters.popleft()
+            if not turn.done():
+                turn.set_result(None)
+                return
+        del self._queues[key]
+
+    @property
+    def busy_chats(self) -> int:
+        return len(self._queues)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware timing every Bot API method"""
+
+    async def __call__(self, make_request, bot, method):
+        start_time = time.perf_counter()
+        method_name = type(method).__name__
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            API_ERRORS.inc(method_name)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - start_time, method_name)
+
+# Outbound send priorities, lower goes first
+OUTBOUND_PRIORITY_CALLBACK = 0
+OUTBOUND_PRIORITY_REPLY = 1
+OUTBOUND_PRIORITY_NOTIFY = 2
+OUTBOUND_PRIORITY_MAINTENANCE = 3
+OUTBOUND_PRIORITY_BROADCAST = 4
+OUTBOUND_PRIORITY_NAMES = ("callback", "reply", "notify", "maintenance", "broadcast")
+# Sends that post or change a message count against the chat's limit, deletes and probes only the global one
+OUTBOUND_CHAT_METHODS = (SendMessage, SendPhoto, CopyMessage, EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+OUTBOUND_GLOBAL_METHODS = (ForwardMessages, DeleteMessage, DeleteMessages)
+OUTBOUND_DROPPABLE_METHODS = (SendMessage, SendPhoto)
+OUTBOUND_EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+# Set while a button press is handled, so everything it sends jumps the queue
+outbound_priority: contextvars.ContextVar = contextvars.ContextVar("outbound_priority", default=None)
+
+class OutboundDropped(Exception):
+    """Raised instead of sending when a group's outbound queue is already too deep"""
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Session middleware pacing sends behind global and per-chat token buckets, one send per chat at a time"""
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE):
+        self.global_bucket = TokenBucket(global_rate)
+        self.group_limiter = ChatRateLimiter(OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST)
+        self.private_limiter = ChatRateLimiter(OUTBOUND_PRIVATE_RATE, OUTBOUND_PRIVATE_BURST)
+        self._sequence = itertools.count()
+        # Chats (or (chat, message) for edits) with a send in flight, mapped to a heap of the sends waiting behind it
+        self._lanes: Dict[object, list] = {}
+        # Sends waiting for a global token, most urgent first
+        self._gate: list = []
+        self._gate_task: Optional[asyncio.Task] = None
+        # Latest edit per (chat, message, priority) as [future, newer entry, revoked], older queued edits resolve with
+        # the newest; a revoked entry was cancelled before it went out, so edits merged into it must send their own
+        self._edits: Dict[tuple, list] = {}
+        self._posted: Set[asyncio.Task] = set()
+        self.pending = 0
+
+    def priority_for(self, method, chat_id) -> int:
+        if isinstance(method, CopyMessage):
+            return OUTBOUND_PRIORITY_BROADCAST
+        priority = outbound_priority.get()
+        if priority is not None:
+            return priority
+        if isinstance(method, OUTBOUND_GLOBAL_METHODS):
+            return OUTBOUND_PRIORITY_MAINTENANCE
+        return OUTBOUND_PRIORITY_REPLY if isinstance(chat_id, int) and chat_id > 0 else OUTBOUND_PRIORITY_NOTIFY
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if isinstance(method, OUTBOUND_CHAT_METHODS) and chat_id is not None:
+            limiter = self.private_limiter if isinstance(chat_id, int) and chat_id > 0 else self.group_limiter
+        elif isinstance(method, OUTBOUND_GLOBAL_METHODS):
+            chat_id = limiter = None
+        else:
+            # Callback answers and housekeeping calls are not message sends, they never wait
+            return await make_request(bot, method)
+
+        priority = self.priority_for(method, chat_id)
+        method_name = type(method).__name__
+        lane = chat_id
+        if chat_id is not None and isinstance(method, OUTBOUND_EDIT_METHODS) and method.message_id is not None:
+            # An edit only has to follow earlier edits of its own message, not queue behind the chat's sends
+            lane = (chat_id, method.message_id)
+            if priority == OUTBOUND_PRIORITY_CALLBACK:
+                # A press answered by editing its own message skips the chat bucket, a burst of presses
+                # must not leave the group's later updates waiting on the 20/min limit
+                limiter = None
+        waiters = self._lanes.get(lane) if lane is not None else None
+        if (waiters is not None and len(waiters) >= OUTBOUND_CHAT_QUEUE_LIMIT
+                and priority >= OUTBOUND_PRIORITY_NOTIFY and isinstance(method, OUTBOUND_DROPPABLE_METHODS)):
+            OUTBOUND_DROPPED.inc(method_name)
+            raise OutboundDropped(f"{method_name} dropped, {len(waiters)} sends already queued for chat {chat_id}")
+
+        key = entry = None
+        if isinstance(method, EditMessageText) and isinstance(lane, tuple):
+            # Only edits with the same intent merge: a queued reveal is never replaced by a content refresh or vice versa
+            key = lane + (priority,)
+            entry = [asyncio.get_running_loop().create_future(), None, False]
+            previous = self._edits.get(key)
+            if previous is not None:
+                previous[1] = entry
+            self._edits[key] = entry
+
+        queued_at = time.perf_counter()
+        self.pending += 1
+        try:
+            while True:
+                if lane is not None:
+                    await self._wait_turn(lane, priority)
+                try:
+                    # A newer edit of this message queued behind us wins, unless it has been revoked since
+                    latest = self._newest_edit(entry)
+                    if latest is None:
+                        result = await self._send(make_request, bot, method, chat_id, limiter, priority, queued_at)
+                finally:
+                    if lane is not None:
+                        self._release(lane)
+                if latest is None:
+                    break
+                result = await asyncio.shield(latest[0])
+                if not latest[2]:
+                    OUTBOUND_MERGED.inc()
+                    logger.debug("🔀 Queued edit of message %s in %s merged into a newer one", key[1], chat_id)
+                    break
+                # The edit we deferred to was cancelled before it went out, queue up again with our own text
+        except BaseException as error:
+            if entry is not None and not entry[0].done():
+                if isinstance(error, Exception):
+                    entry[0].set_exception(error)
+                    entry[0].exception()  # Merged edits may or may not be waiting on it
+                else:
+                    entry[2] = True
+                    entry[0].set_result(None)
+            raise
+        else:
+            if entry is not None and not entry[0].done():
+                entry[0].set_result(result)
+            return result
+        finally:
+            self.pending -= 1
+            if entry is not None and self._edits.get(key) is entry:
+                del self._edits[key]
+
+    @staticmethod
+    def _newest_edit(entry: Optional[list]) -> Optional[list]:
+        latest = None
+        newer = entry[1] if entry is not None else None
+        while newer is not None:
+            if not newer[2]:
+                latest = newer
+            newer = newer[1]
+        return latest
+
+    async def _send(self, make_request, bot, method, chat_id, limiter: Optional[ChatRateLimiter], priority: int, queued_at: float):
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            if limiter is not None:
+                await limiter.acquire(chat_id)
+            await self._acquire_global(priority)
+            if attempt == 0:
+                OUTBOUND_WAIT.observe(time.perf_counter() - queued_at, OUTBOUND_PRIORITY_NAMES[priority])
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as flood_error:
+                if attempt == OUTBOUND_MAX_RETRIES or flood_error.retry_after > OUTBOUND_MAX_RETRY_AFTER:
+                    raise
+                if limiter is not None:
+                    limiter.pause(chat_id, flood_error.retry_after)
+                else:
+                    self.global_bucket.pause(flood_error.retry_after)
+                OUTBOUND_RETRIES.inc(type(method).__name__)
+                logger.warning("⏳ %s to %s hit a flood wait of %ss, retrying (attempt %s)",
+                               type(method).__name__, chat_id, flood_error.retry_after, attempt + 1)
+
+    async def _wait_turn(self, lane, priority: int) -> None:
+        waiters = self._lanes.get(lane)
+        if waiters is None:
+            self._lanes[lane] = []
+            return
+        turn = asyncio.get_running_loop().create_future()
+        heapq.heappush(waiters, (priority, next(self._sequence), turn))
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if turn.done() and not turn.cancelled():
+                self._release(lane)  # The lane was already handed to us, pass it on
+            raise
+
+    def _release(self, lane) -> None:
+        # Hand the lane to its most urgent live waiter, or forget it once nothing is queued
+        waiters = self._lanes[lane]
+        while waiters:
+            turn = heapq.heappop(waiters)[2]
+            if not turn.done():
+                turn.set_result(None)
+                return
+        del self._lanes[lane]
+
+    async def _acquire_global(self, priority: int) -> None:
+        if not self._gate and self.global_bucket.try_acquire() <= 0:
+            return
+        turn = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._gate, (priority, next(self._sequence), turn))
+        if self._gate_task is None:
+            self._gate_task = asyncio.create_task(self._open_gate())
+        await turn
+
+    async def _open_gate(self) -> None:
+        # Each global token goes to the most urgent waiter
+        try:
+            while self._gate:
+                wait = self.global_bucket.try_acquire()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                while self._gate:
+                    turn = heapq.heappop(self._gate)[2]
+                    if not turn.done():
+                        turn.set_result(None)
+                        break
+        finally:
+            self._gate_task = None
+
+    def post(self, send, what: str) -> None:
+        # Fire and forget: the handler returns at once, so pacing delays the send but never the chat's next update
+        task = asyncio.create_task(send)
+        self._posted.add(task)
+        task.add_done_callback(lambda done: self._posted_done(done, what))
+
+    def _posted_done(self, task: asyncio.Task, what: str) -> None:
+        self._posted.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if isinstance(error, OutboundDropped):
+            logger.warning("🚦 %s dropped: %s", what, error)
+        elif error is not None:
+            logger.error("❌ Failed to send %s: %s", what, error)
+
+    @property
+    def busy_chats(self) -> int:
+        return len({lane[0] if isinstance(lane, tuple) else lane for lane in self._lanes})
+
+class CallbackRouter:
+    """Callback query dispatch table keyed by the data prefix before the first ':'"""
+
+    def __init__(self):
+        self._routes: Dict[str, tuple] = {}
+
+    def route(self, *names: str, rate: Optional[float] = None, capacity: Optional[float] = None):
+        # Optional token bucket per (chat, user), so one presser cannot monopolise the chat's edits
+        def register(handler):
+            limiter = ChatRateLimiter(rate, capacity) if rate is not None else None
+            for name in names:
+                self._routes[name] = (handler, limiter)
+            return handler
+        return register
+
+    async def dispatch(self, callback_query: types.CallbackQuery) -> bool:
+        # Returns False when no route matches the data
+        name = callback_query.data.split(":", 1)[0] if callback_query.data else ""
+        route = self._routes.get(name)
+        if route is None:
+            return False
+
+        handler, limiter = route
+        if limiter is not None:
+            chat_id = callback_query.message.chat.id if callback_query.message else None
+            wait = limiter.bucket((chat_id, callback_query.from_user.id)).try_acquire()
+            if wait > 0:
+                CALLBACK_THROTTLED.inc(name)
+                logger.debug("🚦 Callback %s from %s throttled for %.1fs", name, callback_query.from_user.id, wait)
+                await callback_query.answer(f"🌷 Easy there, sweetie! Try again in {math.ceil(wait)}s")
+                return True
+
+        start_time = time.perf_counter()
+        priority_token = outbound_priority.set(OUTBOUND_PRIORITY_CALLBACK)
+        try:
+            await handler(callback_query)
+        finally:
+            outbound_priority.reset(priority_token)
+            CALLBACK_LATENCY.observe(time.perf_counter() - start_time, name)
+        return True
+
+# Bot API client session
+def create_api_session(**kwargs) -> AiohttpSession:
+    # Configured only through AiohttpSession's public constructor arguments, explicit kwargs win
+    if BOT_API_URL:
+        kwargs.setdefault("api", TelegramAPIServer.from_base(BOT_API_URL))
+    if API_SESSION_TUNING:
+        # Every handler slot and broadcast worker can hold a connection
+        kwargs.setdefault("limit", API_CONNECTION_LIMIT)
+        kwargs.setdefault("timeout", API_REQUEST_TIMEOUT)
+        if orjson is not None:
+            kwargs.setdefault("json_loads", orjson.loads)
+            kwargs.setdefault("json_dumps", lambda value: orjson.dumps(value).decode())
+    return AiohttpSession(**kwargs)
+
 # Initialize Bot and Dispatcher at module level
 bot = None
 dp = Dispatcher()  # Initialize dispatcher here!
+dp.update.outer_middleware(UpdateMetricsMiddleware())
+chat_ordering = ChatOrderingMiddleware()
+dp.update.outer_middleware(chat_ordering)
+outbound_scheduler = OutboundScheduler()
+for observer in (dp.message, dp.edited_message, dp.callback_query, dp.chat_member):
+    observer.middleware(HandlerMetricsMiddleware())
+callback_router = CallbackRouter()
 active_chats: Set[int] = set()
-edit_data_cache = {}
+edit_data_cache = EditDataCache()
 
-def extract_user_info(msg: Message) -> Dict[str, any]:
-    """Extract user and chat information from message"""
-    logger.debug("🔍 Extracting user information from message")
-    try:
-        u = msg.from_user
-        c = msg.chat
-        info = {
-            "user_id": u.id if u else None,
-            "username": u.username if u else None,
-            "full_name": u.full_name if u else "Unknown",
-            "first_name": u.first_name if u else None,
-            "last_name": u.last_name if u else None,
-            "chat_id": c.id,
-            "chat_type": c.type,
-            "chat_title": c.title or c.first_name or "",
-            "chat_username": f"@{c.username}" if c.username else "No Username",
-            "chat_link": f"https://t.me/{c.username}" if c.username else "No Link",
-        }
-        logger.info(
-            f"📑 User info extracted: {info['full_name']} (@{info['username']}) "
-            f"[ID: {info['user_id']}] in {info['chat_title']} [{info['chat_id']}] {info['chat_link']}"
-        )
-        return info
-    except Exception as e:
-        logger.error(f"❌ Failed to extract user info: {e}")
+class BotIdentity:
+    """Bot account details fetched once at startup and refreshed on a schedule"""
+
+    def __init__(self):
+        self.id: Optional[int] = None
+        self.username: Optional[str] = None
+        self.refreshed_at = 0.0
+        self.latency_ms: Optional[float] = None
+
+    async def refresh(self):
+        # One getMe round trip, also recorded as the last measured API latency
+        start_time = time.perf_counter()
+        bot_info = await bot.get_me()
+        self.latency_ms = round((time.perf_counter() - start_time) * 1000, 2)
+        self.id = bot_info.id
+        self.username = bot_info.username
+        self.refreshed_at = time.time()
+        logger.debug("🤖 Bot identity refreshed - @%s (%s) in %sms", self.username, self.id, self.latency_ms)
+        return bot_info
+
+    async def ensure(self) -> None:
+        # Only hits the API if startup refresh has not completed yet
+        if self.id is None:
+            await self.refresh()
+
+bot_identity = BotIdentity()
+
+class AdminCache:
+    """Per-chat admin id sets with a TTL, concurrent misses share one getChatAdministrators call"""
+
+    def __init__(self, ttl: float = ADMIN_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[int, tuple] = {}
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_admins(self, chat_id: int) -> frozenset:
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        pending = self._inflight.get(chat_id)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # This waiter was cancelled itself
+            # The leading call was cancelled, the first waiter to get here makes a fresh one
+            return await self.get_admins(chat_id)
+
+        pending = self._inflight[chat_id] = asyncio.get_running_loop().create_future()
+        try:
+            administrators = await bot.get_chat_administrators(chat_id)
+            admin_ids = frozenset(member.user.id for member in administrators)
+            self._entries[chat_id] = (time.monotonic() + self.ttl, admin_ids)
+            pending.set_result(admin_ids)
+            logger.debug("👮 Cached %s admins for chat %s", len(admin_ids), chat_id)
+            return admin_ids
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # Mark retrieved, waiters still receive it
+            raise
+        finally:
+            # A cancelled leader must not leave its waiters hanging on the shared future
+            if not pending.done():
+                pending.cancel()
+            if self._inflight.get(chat_id) is pending:
+                del self._inflight[chat_id]
+
+    async def is_admin(self, chat_id: int, user_id: int) -> bool:
+        return user_id in await self.get_admins(chat_id)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._entries.pop(chat_id, None)
+
+    def expire(self) -> int:
+        now = time.monotonic()
+        expired = [chat_id for chat_id, entry in self._entries.items() if entry[0] <= now]
+        for chat_id in expired:
+            del self._entries[chat_id]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+admin_cache = AdminCache()
+
+class PhotoCache:
+    """Image URL to Telegram file_id, so each picture is fetched from its host only once"""
+
+    def __init__(self):
+        self._file_ids: Dict[str, str] = {}
+
+    def load(self, url: str, file_id: str) -> None:
+        self._file_ids[url] = file_id
+
+    def get(self, url: str) -> Optional[str]:
+        return self._file_ids.get(url)
+
+    def remember(self, url: str, sent: Message) -> None:
+        if not sent.photo:
+            return
+        file_id = sent.photo[-1].file_id  # Largest size, the one Telegram resends as is
+        if self._file_ids.get(url) != file_id:
+            self._file_ids[url] = file_id
+            persistence.enqueue('photo_file_id', (url, file_id))
+
+    def forget(self, url: str) -> None:
+        if self._file_ids.pop(url, None) is not None:
+            persistence.enqueue('delete_photo_file_id', (url,))
+
+    async def reply(self, message: Message, url: str, **kwargs) -> Message:
+        # Reply with the cached file_id when there is one, falling back to the URL if Telegram rejects it
+        file_id = self._file_ids.get(url)
+        if file_id is not None:
+            try:
+                sent = await message.reply_photo(photo=file_id, **kwargs)
+                PHOTO_SENDS.inc("file_id")
+                return sent
+            except TelegramBadRequest as e:
+                if not any(fragment in e.message.lower() for fragment in PHOTO_FILE_ID_ERRORS):
+                    raise
+                logger.warning("⚠️ Cached file_id for %s rejected, resending from URL: %s", url, e)
+                self.forget(url)
+                source = "fallback"
+        else:
+            source = "url"
+
+        sent = await message.reply_photo(photo=url, **kwargs)
+        PHOTO_SENDS.inc(source)
+        self.remember(url, sent)
+        return sent
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+photo_cache = PhotoCache()
+
+METRICS.extend([
+    Gauge("susninja_cached_messages", "Messages in the cache", lambda: message_store.total_messages),
+    Gauge("susninja_cached_bytes", "Approximate cache size in bytes", lambda: message_store.total_bytes),
+    Gauge("susninja_cached_chats", "Chats with cached messages", lambda: message_store.active_chats),
+    Gauge("susninja_edit_cache_entries", "Edit histories kept for reveal", lambda: len(edit_data_cache)),
+    Gauge("susninja_deletion_tracked_chats", "Chats with a recent message id window", lambda: len(deletion_tracker)),
+    Gauge("susninja_photo_file_ids", "Images with a cached file_id", lambda: len(photo_cache)),
+    Gauge("susninja_admin_cache_chats", "Chats with a cached admin set", lambda: len(admin_cache)),
+    Gauge("susninja_chat_queue_depth", "Updates waiting behind an earlier update of their chat", lambda: chat_ordering.waiting),
+    Gauge("susninja_chat_queue_chats", "Chats with an update in flight", lambda: chat_ordering.busy_chats),
+    Gauge("susninja_updates_in_flight", "Updates being handled, capped by UPDATE_CONCURRENCY", lambda: chat_ordering.running),
+    Gauge("susninja_outbound_pending", "Bot API sends queued or in flight in the outbound scheduler", lambda: outbound_scheduler.pending),
+    Gauge("susninja_outbound_chats", "Chats with a Bot API send in flight", lambda: outbound_scheduler.busy_chats),
+    Gauge("susninja_active_chats", "Chats the bot is active in", lambda: len(active_chats)),
+    Gauge("susninja_users", "Known users", lambda: len(user_ids)),
+    Gauge("susninja_groups", "Known groups", lambda: len(group_ids)),
+    Gauge("susninja_log_records_dropped", "Log records dropped by the log queue", lambda: log_queue.dropped),
+])
+
+class LogContext:
+    """User and chat details for a log line, only formatted if the record is emitted"""
+    __slots__ = ('user', 'chat')
+
+    def __init__(self, user=None, chat=None):
+        self.user = user
+        self.chat = chat
+
+    def as_extra(self) -> Dict[str, any]:
+        # Structured fields attached to the LogRecord for handlers that want them
         return {
-            "user_id": None,
-            "username": None,
-            "full_name": "Unknown",
-            "first_name": None,
-            "last_name": None,
-            "chat_id": msg.chat.id if msg.chat else None,
-            "chat_type": msg.chat.type if msg.chat else None,
-            "chat_title": "Unknown",
-            "chat_username": "No Username",
-            "chat_link": "No Link",
+            "user_id": self.user.id if self.user else None,
+            "chat_id": self.chat.id if self.chat else None,
+            "chat_type": self.chat.type if self.chat else None,
         }
 
-def log_with_user_info(level: str, message: str, user_info: Dict[str, any]) -> None:
-    """Log message with user information"""
-    try:
-        user_detail = (
-            f"👤 {user_info['full_name']} (@{user_info['username']}) "
-            f"[ID: {user_info['user_id']}] | "
-            f"💬 {user_info['chat_title']} [{user_info['chat_id']}] "
-            f"({user_info['chat_type']}) {user_info['chat_link']}"
-        )
-        full_message = f"{message} | {user_detail}"
-
-        if level.upper() == "INFO":
-            logger.info(full_message)
-        elif level.upper() == "DEBUG":
-            logger.debug(full_message)
-        elif level.upper() == "WARNING":
-            logger.warning(full_message)
-        elif level.upper() == "ERROR":
-            logger.error(full_message)
-        else:
-            logger.info(full_message)
-    except Exception as e:
-        logger.error(f"❌ Failed to log with user info: {e}")
-        # Fallback to simple logging
-        getattr(logger, level.lower(), logger.info)(message)
+    def __str__(self) -> str:
+        u = self.user
+        c = self.chat
+        user_detail = f"👤 {u.full_name} (@{u.username}) [ID: {u.id}]" if u else "👤 Unknown"
+        if c is None:
+            return user_detail
+        chat_title = c.title or c.first_name or ""
+        chat_link = f"https://t.me/{c.username}" if c.username else "No Link"
+        return f"{user_detail} | 💬 {chat_title} [{c.id}] ({c.type}) {chat_link}"
+
+LOG_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+
+def extract_user_info(msg: Optional[Message]) -> LogContext:
+    """Wrap the message's user and chat for lazy logging, no formatting happens here"""
+    if msg is None:
+        return LogContext()
+    return LogContext(msg.from_user, msg.chat)
+
+def log_with_user_info(level, message: str, user_info: LogContext, *args) -> None:
+    """Log a %-style message with user context, skipped entirely when the level is disabled"""
+    levelno = LOG_LEVELS.get(level, logging.INFO) if isinstance(level, str) else level
+    if not logger.isEnabledFor(levelno):
+        return
+    logger.log(levelno, message + " | %s", *args, user_info, extra=user_info.as_extra())
 
 # HTTP server for deployment
-class DummyHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        try:
-            logger.debug(f"🌐 HTTP GET request from {self.client_address[0]}")
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b"Sus Ninja Bot is alive and running!")
-        except Exception as e:
-            logger.error(f"❌ HTTP GET error: {e}")
+async def handle_health(request: web.Request) -> web.Response:
+    logger.debug("🌐 HTTP %s request from %s", request.method, request.remote)
+    return web.Response(text="Sus Ninja Bot is alive and running!")
 
-    def do_HEAD(self):
-        try:
-            logger.debug(f"🌐 HTTP HEAD request from {self.client_address[0]}")
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/plain')
-            self.end_headers()
-        except Exception as e:
-            logger.error(f"❌ HTTP HEAD error: {e}")
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+def create_web_app() -> web.Application:
+    # Health checks, metrics and (in webhook mode) Telegram updates share one aiohttp app
+    app = web.Application()
+    app.router.add_get("/", handle_health)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
 
-    def log_message(self, format, *args):
-        pass  # Disable HTTP logging
+    if BOT_MODE == "webhook":
+        SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+        logger.info("🪝 Webhook route registered at %s", WEBHOOK_PATH)
 
-def start_dummy_server():
-    # Start HTTP server for deployment
+    return app
+
+async def start_web_server(app: web.Application) -> web.AppRunner:
     try:
-        logger.info(f"🌐 Starting HTTP server on port {PORT}")
-        server = HTTPServer(("0.0.0.0", PORT), DummyHandler)
-        logger.info(f"✅ HTTP server successfully started on port {PORT}")
-        server.serve_forever()
+        logger.info("🌐 Starting HTTP server on port %s", PORT)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", PORT).start()
+        logger.info("✅ HTTP server successfully started on port %s", PORT)
+        return runner
     except Exception as e:
-        logger.error(f"❌ HTTP server critical error: {e}")
+        logger.error("❌ HTTP server critical error: %s", e)
         raise
 
+# Persistence
+class PersistenceBackend:
+    """Storage backend interface, every method runs on the persistence thread"""
+
+    def open(self) -> None:
+        pass
+
+    def load(self, min_timestamp: int) -> dict:
+        return {'users': [], 'groups': [], 'active_chats': [], 'user_names': [], 'messages': [], 'photo_file_ids': []}
+
+    def load_edit_history(self, chat_id: int, message_id: int) -> Optional[tuple]:
+        return None
+
+    def load_known_ids(self) -> tuple:
+        return [], []
+
+    def write_batch(self, ops: list) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class SQLiteBackend(PersistenceBackend):
+    """SQLite backend in WAL mode, each batch is applied in one transaction"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY)",
+        "CREATE TABLE IF NOT EXISTS groups (chat_id INTEGER PRIMARY KEY)",
+        "CREATE TABLE IF NOT EXISTS active_chats (chat_id INTEGER PRIMARY KEY)",
+        "CREATE TABLE IF NOT EXISTS user_names ("
+        "user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT)",
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "chat_id INTEGER, message_id INTEGER, text TEXT, user_id INTEGER, timestamp INTEGER, "
+        "date INTEGER, reply_to_message_id INTEGER, PRIMARY KEY (chat_id, message_id)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (timestamp)",
+        "CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id)",
+        "CREATE TABLE IF NOT EXISTS edit_histories ("
+        "chat_id INTEGER, message_id INTEGER, latest TEXT, deltas TEXT, edits INTEGER, editor_id INTEGER, "
+        "editor_mention TEXT, touched INTEGER, PRIMARY KEY (chat_id, message_id)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS edit_histories_touched ON edit_histories (touched)",
+        "CREATE TABLE IF NOT EXISTS photo_file_ids (url TEXT PRIMARY KEY, file_id TEXT)",
+    )
+
+    WRITES = {
+        'user': "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
+        'group': "INSERT OR IGNORE INTO groups (chat_id) VALUES (?)",
+        'active_chat': "INSERT OR IGNORE INTO active_chats (chat_id) VALUES (?)",
+        'user_names': "INSERT OR REPLACE INTO user_names VALUES (?, ?, ?, ?)",
+        # Another worker process may still cache messages by the user, their rows keep the names alive
+        'delete_user_names': "DELETE FROM user_names WHERE user_id = ?1 AND NOT EXISTS (SELECT 1 FROM messages WHERE user_id = ?1)",
+        'message': "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+        'delete_message': "DELETE FROM messages WHERE chat_id = ? AND message_id = ?",
+        'expire_before': "DELETE FROM messages WHERE timestamp < ?",
+        'edit_history': "INSERT OR REPLACE INTO edit_histories VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        'delete_edit_history': "DELETE FROM edit_histories WHERE chat_id = ? AND message_id = ?",
+        'expire_edit_histories': "DELETE FROM edit_histories WHERE touched < ?",
+        'photo_file_id': "INSERT OR REPLACE INTO photo_file_ids VALUES (?, ?)",
+        'delete_photo_file_id': "DELETE FROM photo_file_ids WHERE url = ?",
+    }
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+
+    def load(self, min_timestamp: int) -> dict:
+        conn = self.conn
+        return {
+            'users': [row[0] for row in conn.execute("SELECT user_id FROM users")],
+            'groups': [row[0] for row in conn.execute("SELECT chat_id FROM groups")],
+            'active_chats': [row[0] for row in conn.execute("SELECT chat_id FROM active_chats")],
+            'user_names': conn.execute("SELECT * FROM user_names").fetchall(),
+            'messages': conn.execute(
+                "SELECT * FROM messages WHERE timestamp >= ? ORDER BY timestamp", (min_timestamp,)
+            ).fetchall(),
+            'photo_file_ids': conn.execute("SELECT url, file_id FROM photo_file_ids").fetchall(),
+        }
+
+    def load_edit_history(self, chat_id: int, message_id: int) -> Optional[tuple]:
+        return self.conn.execute(
+            "SELECT latest, deltas, edits, editor_id, editor_mention, touched FROM edit_histories "
+            "WHERE chat_id = ? AND message_id = ?", (chat_id, message_id)
+        ).fetchone()
+
+    def load_known_ids(self) -> tuple:
+        conn = self.conn
+        return (
+            [row[0] for row in conn.execute("SELECT user_id FROM users")],
+            [row[0] for row in conn.execute("SELECT chat_id FROM groups")],
+        )
+
+    def write_batch(self, ops: list) -> None:
+        # Consecutive ops of one kind become one executemany, all inside a single transaction;
+        # runs keep their order so a write followed by a delete of the same row stays deleted
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            for kind, run in itertools.groupby(ops, key=operator.itemgetter(0)):
+                conn.executemany(self.WRITES[kind], [params for _, params in run])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+PERSISTENCE_BACKENDS = {
+    'none': lambda: PersistenceBackend(),
+    'sqlite': lambda: SQLiteBackend(DATABASE_PATH),
+}
+
+class Persistence:
+    """Queues writes from the event loop and applies them in batches on a dedicated thread"""
+
+    def __init__(self, backend: PersistenceBackend):
+        self.backend = backend
+        self._pending: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        # Single thread so the backend connection is never used concurrently
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+        self.written = 0
+
+    def enqueue(self, kind: str, params) -> None:
+        # Never blocks: the writer task picks the op up on its next flush
+        if self._writer is None:
+            return
+        self._pending.append((kind, params))
+        if len(self._pending) >= PERSIST_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def start(self, shard: int = 0, shards: int = 1) -> None:
+        # Open the backend and warm-start the in-memory state from it, keeping only this process's chats
+        start_time = time.perf_counter()
+        await self._run(self.backend.open)
+        snapshot = await self._run(self.backend.load, int(time.time()) - MESSAGE_TTL)
+
+        user_ids.update(snapshot['users'])
+        group_ids.update(snapshot['groups'])
+        active_chats.update(snapshot['active_chats'])
+        for chat_id, message_id, text, user_id, timestamp, date, reply_to_message_id in snapshot['messages']:
+            if chat_id % shards != shard:
+                continue
+            message_store.add(chat_id, message_id, CachedMessage(message_id, text, user_id, timestamp, date, reply_to_message_id))
+            deletion_tracker.mark(chat_id, message_id)
+        for url, file_id in snapshot['photo_file_ids']:
+            photo_cache.load(url, file_id)
+
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+        # Names are only kept for authors of the cached messages, rows left over from expired ones are dropped
+        for user_id, username, first_name, last_name in snapshot['user_names']:
+            if message_store.refers_to(user_id):
+                user_table.load(user_id, username, first_name, last_name)
+            else:
+                self.enqueue('delete_user_names', (user_id,))
+        logger.info(
+            "💾 Warm start from %s in %.2fms - Users: %s, Groups: %s, Messages: %s, Photo file_ids: %s",
+            type(self.backend).__name__, (time.perf_counter() - start_time) * 1000,
+            len(snapshot['users']), len(snapshot['groups']), len(snapshot['messages']), len(snapshot['photo_file_ids'])
+        )
+
+    async def fetch_edit_history(self, chat_id: int, message_id: int) -> Optional[tuple]:
+        # Flush first so a history written moments ago is visible to the read
+        if self._writer is None:
+            return None
+        await self.flush()
+        return await self._run(self.backend.load_edit_history, chat_id, message_id)
+
+    async def refresh_known_ids(self) -> None:
+        # Other worker processes track users and groups too, the shared store has all of them
+        if self._writer is None:
+            return
+        await self.flush()
+        users, groups = await self._run(self.backend.load_known_ids)
+        user_ids.update(users)
+        group_ids.update(groups)
+
+    async def _write_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=PERSIST_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        self._wakeup.clear()
+        for user_id in user_table.dirty:
+            names = user_table.get(user_id)
+            self._pending.append(('user_names', (user_id, names.username, names.first_name, names.last_name)))
+        user_table.dirty.clear()
+
+        if not self._pending:
+            return
+        ops, self._pending = self._pending, []
+        try:
+            await self._run(self.backend.write_batch, ops)
+            self.written += len(ops)
+            logger.debug("💾 Persisted batch of %s writes", len(ops))
+        except Exception as e:
+            logger.error("❌ Persistence write error, dropped %s writes: %s", len(ops), e)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+            await self.flush()
+        await self._run(self.backend.close)
+        self._executor.shutdown(wait=True)
+
+def create_persistence() -> Persistence:
+    factory = PERSISTENCE_BACKENDS.get(PERSISTENCE_BACKEND)
+    if factory is None:
+        logger.warning("⚠️ Unknown persistence backend '%s' - running without persistence", PERSISTENCE_BACKEND)
+        factory = PERSISTENCE_BACKENDS['none']
+    return Persistence(factory())
+
+persistence = create_persistence()
+
+def track_user(user_id: int) -> None:
+    if user_id not in user_ids:
+        user_ids.add(user_id)
+        persistence.enqueue('user', (user_id,))
+
+def track_group(chat_id: int) -> None:
+    if chat_id not in group_ids:
+        group_ids.add(chat_id)
+        persistence.enqueue('group', (chat_id,))
+
+def track_active_chat(chat_id: int) -> None:
+    if chat_id not in active_chats:
+        active_chats.add(chat_id)
+        persistence.enqueue('active_chat', (chat_id,))
+
 # Message cache functions
 def add_message(chat_id: int, message: Message) -> None:
     # Add message to cache
     try:
-        logger.debug(f"💾 Adding message {message.message_id} to cache for chat {chat_id}")
-        user_info = message.from_user
-        msg_data = {
-            'message_id': message.message_id,
-            'text': message.text or message.caption or "",
-            'user_id': user_info.id if user_info else None,
-            'username': user_info.username if user_info else None,
-            'first_name': user_info.first_name if user_info else None,
-            'last_name': user_info.last_name if user_info else None,
-            'timestamp': time.time(),
-            'date': message.date,
-            'reply_to_message_id': message.reply_to_message.message_id if message.reply_to_message else None
-        }
-        
-        messages[chat_id][message.message_id] = msg_data
-        recent_message_ids[chat_id].add(message.message_id)
+        logger.debug("💾 Adding message %s to cache for chat %s", message.message_id, chat_id)
+        msg_data = CachedMessage(
+            message.message_id,
+            message.text or message.caption or "",
+            user_table.remember(message.from_user),
+            int(time.time()),
+            int(message.date.timestamp()) if message.date else 0,
+            message.reply_to_message.message_id if message.reply_to_message else None
+        )
         
-        queue = chat_queues[chat_id]
-        if len(queue) >= MAX_MESSAGES_PER_CHAT:
-            oldest_msg_id = queue.popleft()
-            messages[chat_id].pop(oldest_msg_id, None)
-            recent_message_ids[chat_id].discard(oldest_msg_id)
-            logger.debug(f"🗑️ Removed oldest message {oldest_msg_id} from cache due to size limit")
+        oldest_msg_id = message_store.add(chat_id, message.message_id, msg_data)
+        deletion_tracker.mark(chat_id, message.message_id)
+        if oldest_msg_id is not None:
+            persistence.enqueue('delete_message', (chat_id, oldest_msg_id))
+            logger.debug("🗑️ Removed oldest message %s from cache due to size limit", oldest_msg_id)
+        persistence.enqueue('message', (
+            chat_id, msg_data.message_id, msg_data.text, msg_data.user_id,
+            msg_data.timestamp, msg_data.date, msg_data.reply_to_message_id
+        ))
         
-        queue.append(message.message_id)
-        logger.info(f"✅ Message {message.message_id} cached successfully for chat {chat_id}")
+        logger.debug("✅ Message %s cached successfully for chat %s", message.message_id, chat_id)
         
     except Exception as e:
-        logger.error(f"❌ Cache add error for message {message.message_id} in chat {chat_id}: {e}")
+        logger.error("❌ Cache add error for message %s in chat %s: %s", message.message_id, chat_id, e)
 
-def get_message(chat_id: int, message_id: int) -> Optional[dict]:
+def get_message(chat_id: int, message_id: int) -> Optional[CachedMessage]:
     # Get message from cache
     try:
-        logger.debug(f"🔍 Retrieving message {message_id} from cache for chat {chat_id}")
-        msg_data = messages.get(chat_id, {}).get(message_id)
+        logger.debug("🔍 Retrieving message %s from cache for chat %s", message_id, chat_id)
+        msg_data = message_store.get(chat_id, message_id)
         if msg_data:
-            logger.debug(f"✅ Message {message_id} found in cache")
+            CACHE_REQUESTS.inc("hit")
+            logger.debug("✅ Message %s found in cache", message_id)
         else:
-            logger.debug(f"❌ Message {message_id} not found in cache")
+            CACHE_REQUESTS.inc("miss")
+            logger.debug("❌ Message %s not found in cache", message_id)
         return msg_data
     except Exception as e:
-        logger.error(f"❌ Cache retrieval error for message {message_id} in chat {chat_id}: {e}")
+        logger.error("❌ Cache retrieval error for message %s in chat %s: %s", message_id, chat_id, e)
         return None
 
-def remove_message(chat_id: int, message_id: int) -> Optional[dict]:
+def remove_message(chat_id: int, message_id: int) -> Optional[CachedMessage]:
     # Remove message from cache
     try:
-        logger.debug(f"🗑️ Removing message {message_id} from cache for chat {chat_id}")
-        msg_data = messages.get(chat_id, {}).pop(message_id, None)
+        logger.debug("🗑️ Removing message %s from cache for chat %s", message_id, chat_id)
+        msg_data = message_store.remove(chat_id, message_id)
+        deletion_tracker.discard(chat_id, message_id)
         if msg_data:
-            try:
-                chat_queues[chat_id].remove(message_id)
-                logger.debug(f"✅ Message {message_id} removed from queue")
-            except ValueError:
-                logger.warning(f"⚠️ Message {message_id} not found in queue during removal")
-            recent_message_ids[chat_id].discard(message_id)
-            logger.info(f"✅ Message {message_id} successfully removed from cache")
+            persistence.enqueue('delete_message', (chat_id, message_id))
+            logger.info("✅ Message %s successfully removed from cache", message_id)
         else:
-            logger.debug(f"❌ Message {message_id} not found for removal")
+            logger.debug("❌ Message %s not found for removal", message_id)
         return msg_data
     except Exception as e:
-        logger.error(f"❌ Cache removal error for message {message_id} in chat {chat_id}: {e}")
+        logger.error("❌ Cache removal error for message %s in chat %s: %s", message_id, chat_id, e)
+        return None
+
+def persist_edit_history(chat_id: int, message_id: int, history: EditHistory) -> None:
+    deltas = json.dumps(history.deltas, ensure_ascii=False, separators=(',', ':'))
+    persistence.enqueue('edit_history', (
+        chat_id, message_id, history.latest, deltas, history.edits,
+        history.editor_id, history.editor_mention, int(time.time())
+    ))
+
+async def load_edit_history(chat_id: int, message_id: int) -> Optional[EditHistory]:
+    # Cache miss fallback: rebuild the history from persisted state, e.g. after a restart
+    try:
+        row = await persistence.fetch_edit_history(chat_id, message_id)
+    except Exception as e:
+        logger.error("❌ Edit history load error for message %s in chat %s: %s", message_id, chat_id, e)
+        return None
+    if row is None:
+        return None
+
+    latest, deltas, edits, editor_id, editor_mention, touched = row
+    history = EditHistory(latest, editor_id, editor_mention)
+    history.deltas = [
+        tuple((start, end, tuple(replacement)) for start, end, replacement in delta)
+        for delta in json.loads(deltas)
+    ]
+    history.edits = edits
+    edit_data_cache.put((chat_id, message_id), history)
+    logger.debug("💾 Edit history for message %s in chat %s restored from storage", message_id, chat_id)
+    return history
+
+def cleanup_expired(max_items: int = EXPIRY_BATCH_SIZE) -> int:
+    # Remove expired messages, bounded to max_items per call
+    try:
+        cutoff = int(time.time()) - MESSAGE_TTL
+        removed = message_store.expire(cutoff, max_items)
+        if removed:
+            persistence.enqueue('expire_before', (cutoff,))
+            logger.debug("🗑️ Removed %s expired messages from cache", removed)
+        return removed
+    except Exception as e:
+        logger.error("❌ Cleanup error: %s", e)
+        return 0
+
+def enforce_memory_limit(max_items: int = EXPIRY_BATCH_SIZE) -> int:
+    # Shrink the cache toward the low-water mark once it crosses the high-water mark
+    if message_store.total_bytes < CACHE_HIGH_WATER_BYTES:
+        return 0
+    try:
+        evicted = []
+        removed = message_store.shrink(CACHE_LOW_WATER_BYTES, max_items, evicted)
+        # Evictions are deleted from storage too, or the next warm start would load them straight back
+        for key in evicted:
+            persistence.enqueue('delete_message', key)
+        logger.warning(
+            "⚠️ Cache over high-water mark - Evicted %s oldest messages, %s bytes remaining",
+            removed, message_store.total_bytes
+        )
+        return removed
+    except Exception as e:
+        logger.error("❌ Cache shrink error: %s", e)
+        return 0
+
+# Notifications
+EDIT_DIFF_MAX_LENGTH = 1500
+EDIT_DIFF_CONTEXT_TOKENS = 12
+
+def escape_text(text: str) -> str:
+    if not text:
+        return "(No text)"
+    return html.escape(text, quote=False)
+
+def mention_for(user_id: Optional[int]) -> str:
+    names = user_table.get(user_id)
+    if names is None:
+        return "Unknown User"
+    full_name = " ".join(filter(None, (names.first_name, names.last_name))) or names.username or "Unknown User"
+    return f'<a href="tg://user?id={user_id}">{html.escape(full_name)}</a>'
+
+CALLBACK_KEY = hashlib.sha256(
+    CALLBACK_SECRET.encode() if CALLBACK_SECRET else b"susninja-callback:" + BOT_TOKEN.encode()
+).digest()
+
+def sign_callback(*fields) -> str:
+    # Truncated HMAC-SHA256, base64url without padding: 11 characters for the default 8 bytes
+    payload = ":".join(str(field) for field in fields).encode()
+    digest = hmac.new(CALLBACK_KEY, payload, hashlib.sha256).digest()[:CALLBACK_SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def edit_callback_data(action: str, chat_id: int, message_id: int, editor_id: int, reveal: bool = False) -> str:
+    # reveal_edit:<1 to reveal, 0 to hide>:<message id>:<editor id>:<sig>, dismiss_edit:<message id>:<editor id>:<sig>
+    # The chat is signed but not sent, it comes from the message the button is attached to
+    if action == "reveal_edit":
+        state = int(reveal)
+        return f"{action}:{state}:{message_id}:{editor_id}:{sign_callback(action, chat_id, state, message_id, editor_id)}"
+    return f"{action}:{message_id}:{editor_id}:{sign_callback(action, chat_id, message_id, editor_id)}"
+
+def parse_edit_callback(data: str, chat_id: int) -> Optional[tuple]:
+    # (reveal, message_id, editor_id) from signed button data, None if it is malformed or was not signed by us
+    try:
+        parts = data.split(":")
+        if parts[0] == "reveal_edit" and len(parts) == 5:
+            state, message_id, editor_id = int(parts[1]), int(parts[2]), int(parts[3])
+            expected = sign_callback(parts[0], chat_id, state, message_id, editor_id)
+        elif parts[0] == "dismiss_edit" and len(parts) == 4:
+            state, message_id, editor_id = 0, int(parts[1]), int(parts[2])
+            expected = sign_callback(parts[0], chat_id, message_id, editor_id)
+        else:
+            return None
+    except ValueError:
+        return None
+    if not hmac.compare_digest(expected, parts[-1]):
         return None
+    return bool(state), message_id, editor_id
 
-def cleanup_expired() -> None:
-    # Remove expired messages
-    global last_cleanup
-    current_time = time.time()
-    if current_time - last_cleanup < CLEANUP_INTERVAL:
+def edit_keyboard(chat_id: int, message_id: int, editor_id: int, revealed: bool) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="✉️" if revealed else "👀️",
+                callback_data=edit_callback_data("reveal_edit", chat_id, message_id, editor_id, reveal=not revealed)
+            ),
+            InlineKeyboardButton(
+                text="🗑️",
+                callback_data=edit_callback_data("dismiss_edit", chat_id, message_id, editor_id)
+            )
+        ]
+    ])
+
+def _equal_segment(tokens: list, start: int, end: int, context: Optional[int], leading: bool, trailing: bool) -> tuple:
+    # Unchanged run, cut down to context tokens around the neighbouring changes when asked to
+    if context is None or end - start <= 2 * context:
+        return ('', ''.join(tokens[start:end]))
+    head = '' if leading else ''.join(tokens[start:start + context])
+    tail = '' if trailing else ''.join(tokens[end - context:end])
+    return ('', f"{head}…{tail}")
+
+def diff_segments(newer: list, delta: tuple, context: Optional[int] = None) -> list:
+    # (tag, text) runs of one edit read straight off its reverse delta, no second diff pass
+    segments = []
+    position = 0
+    for start, end, replacement in delta:
+        if start > position:
+            segments.append(_equal_segment(newer, position, start, context, position == 0, False))
+        if replacement:
+            segments.append(('s', ''.join(replacement)))
+        if end > start:
+            segments.append(('u', ''.join(newer[start:end])))
+        position = end
+    if position < len(newer):
+        segments.append(_equal_segment(newer, position, len(newer), context, position == 0, True))
+    return segments
+
+def render_segments(segments: list, budget: int) -> tuple:
+    # Removed text in <s>, inserted text in <u>, cut with an ellipsis rather than exceeding budget; (html, truncated)
+    parts = []
+    length = 0
+    for tag, text in segments:
+        escaped = html.escape(text, quote=False)
+        overhead = 2 * len(tag) + 5 if tag else 0
+        if length + len(escaped) + overhead > budget:
+            room = budget - length - overhead - 1
+            while room > 0:
+                escaped = html.escape(text[:room], quote=False)
+                excess = length + len(escaped) + overhead + 1 - budget
+                if excess <= 0:
+                    break
+                room -= excess
+            if room > 0:
+                parts.append(f"<{tag}>{escaped}</{tag}>" if tag else escaped)
+            parts.append("…")
+            return "".join(parts), True
+        parts.append(f"<{tag}>{escaped}</{tag}>" if tag else escaped)
+        length += len(escaped) + overhead
+    return "".join(parts), False
+
+def render_edit_diff(newer: list, delta: tuple, budget: int) -> str:
+    # Full text when it fits, otherwise only the changes with a little context around them
+    full, truncated = render_segments(diff_segments(newer, delta), budget)
+    if not truncated:
+        return full
+    return render_segments(diff_segments(newer, delta, EDIT_DIFF_CONTEXT_TOKENS), budget)[0]
+
+def render_edit_notification(history: EditHistory, revealed: bool) -> str:
+    # Collapsed view is a single line; the revealed view is an inline diff per edit, computed on first reveal
+    header = f"📝 <b>Message Edited</b> by <b>{history.editor_mention}</b>"
+    if history.edits > 1:
+        header += f" ({history.edits} times)"
+    if not revealed:
+        return header
+
+    if history.reveal_cache is None or history.reveal_cache[0] != history.edits:
+        history.reveal_cache = (history.edits, _render_edit_steps(history, MAX_MESSAGE_LENGTH - len(header) - 2))
+    return header + "\n\n" + history.reveal_cache[1]
+
+def _render_edit_steps(history: EditHistory, budget: int) -> str:
+    # Newest edits first claim the space, each capped so one huge caption cannot crowd out the rest
+    entries = []
+    remaining = budget - 60  # Room for the hidden-versions note
+    for number, tokens, delta in history.steps():
+        label = f"<b>Edit {number}:</b> "
+        room = min(EDIT_DIFF_MAX_LENGTH, remaining - len(label) - 2)
+        if room < 40:
+            break
+        entry = label + render_edit_diff(tokens, delta, room)
+        entries.append(entry)
+        remaining -= len(entry) + 2
+
+    hidden = history.edits - len(entries)
+    entries.reverse()
+    if hidden:
+        entries.insert(0, f"<i>…{hidden} earlier edits not shown</i>" if hidden > 1 else "<i>…1 earlier edit not shown</i>")
+    return "\n\n".join(entries)
+
+async def publish_edit_notification(chat_id: int, message_id: int, history: EditHistory, in_place: bool = False) -> None:
+    # Edits inside the debounce window update the notification in place, a later edit posts a fresh one members will see
+    text = render_edit_notification(history, revealed=False)
+    keyboard = edit_keyboard(chat_id, message_id, history.editor_id, revealed=False)
+
+    if in_place and history.notification_id is not None:
+        try:
+            await bot.edit_message_text(
+                text=text,
+                chat_id=chat_id,
+                message_id=history.notification_id,
+                parse_mode="HTML",
+                reply_markup=keyboard
+            )
+            NOTIFICATIONS_SENT.inc("edit_update")
+            logger.info("✅ Edit notification %s updated for message %s", history.notification_id, message_id)
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return
+            logger.info("🔁 Edit notification for message %s is gone, sending a new one: %s", message_id, e)
+            history.notification_id = None
+
+    try:
+        try:
+            sent = await bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                parse_mode="HTML",
+                reply_markup=keyboard,
+                reply_to_message_id=message_id
+            )
+            logger.info("✅ Edit notification sent for message %s", message_id)
+        except OutboundDropped:
+            raise
+        except Exception as send_error:
+            logger.warning("⚠️ Failed to reply to original message %s: %s", message_id, send_error)
+            sent = await bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                parse_mode="HTML",
+                reply_markup=keyboard
+            )
+            logger.info("✅ Edit notification sent without reply for message %s", message_id)
+        history.notification_id = sent.message_id
+        NOTIFICATIONS_SENT.inc("edit")
+    except OutboundDropped as e:
+        # The next edit of this message publishes a fresh notification
+        logger.warning("🚦 Edit notification for message %s dropped: %s", message_id, e)
+    except Exception as e:
+        logger.error("❌ Failed to send edit notification: %s", e)
+
+pending_edit_notifications: Dict[tuple, asyncio.Task] = {}
+
+def schedule_edit_notification(chat_id: int, message_id: int, history: EditHistory) -> None:
+    # The first edit is published right away; edits inside the window ride along with one trailing update
+    key = (chat_id, message_id)
+    if key in pending_edit_notifications:
+        logger.debug("⏳ Edit of message %s folded into the pending notification update", message_id)
         return
-        
+    pending_edit_notifications[key] = asyncio.create_task(_debounce_edit_notification(key, history))
+
+async def _debounce_edit_notification(key: tuple, history: EditHistory) -> None:
     try:
-        logger.info("🧹 Starting expired message cleanup")
-        total_removed = 0
-        
-        for chat_id in list(messages.keys()):
-            chat_messages = messages[chat_id]
-            expired_msg_ids = []
-            
-            for msg_id, msg_data in chat_messages.items():
-                if current_time - msg_data['timestamp'] > MESSAGE_TTL:
-                    expired_msg_ids.append(msg_id)
-            
-            if expired_msg_ids:
-                logger.debug(f"🗑️ Found {len(expired_msg_ids)} expired messages in chat {chat_id}")
-                for msg_id in expired_msg_ids:
-                    chat_messages.pop(msg_id, None)
-                    try:
-                        chat_queues[chat_id].remove(msg_id)
-                    except ValueError:
-                        pass
-                    recent_message_ids[chat_id].discard(msg_id)
-                    total_removed += 1
-            
-            if not chat_messages:
-                logger.debug(f"🧹 Cleaning up empty chat data for {chat_id}")
-                del messages[chat_id]
-                del chat_queues[chat_id]
-                if chat_id in recent_message_ids:
-                    del recent_message_ids[chat_id]
-        
-        last_cleanup = current_time
-        logger.info(f"✅ Cleanup completed - Removed {total_removed} expired messages")
-            
+        published = history.edits
+        await publish_edit_notification(key[0], key[1], history)
+        while True:
+            await asyncio.sleep(EDIT_DEBOUNCE_WINDOW)
+            if history.edits == published:
+                break
+            # Each folded edit would have been its own call, the trailing update costs one
+            EDIT_CALLS_SAVED.inc(amount=history.edits - published - 1)
+            published = history.edits
+            await publish_edit_notification(key[0], key[1], history, in_place=True)
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.error("❌ Edit notification debounce error for %s: %s", key, e)
+    finally:
+        if pending_edit_notifications.get(key) is asyncio.current_task():
+            del pending_edit_notifications[key]
+
+def cancel_edit_notification(key: tuple) -> None:
+    task = pending_edit_notifications.pop(key, None)
+    if task is not None:
+        task.cancel()
+
+# Deletion detection
+# The Bot API sends no update when a group message is deleted. Forwarding cached ids into the probe
+# chat skips any that no longer exist, so a short result means something in the batch is gone.
+probe_bucket = TokenBucket(DELETION_PROBE_RATE)
+
+async def probe_deleted(chat_id: int, message_ids: list, copies: list, missing: Optional[int] = None) -> list:
+    # Returns the ids that are gone, halving short batches to find them: d deletions in n ids cost ~d*log2(n) calls
+    if missing is not None and missing <= 0:
+        return []
+    if missing == len(message_ids):
+        return message_ids
+
+    await probe_bucket.acquire()
+    DELETION_PROBES.inc()
+    try:
+        forwarded = await bot.forward_messages(
+            chat_id=DELETION_PROBE_CHAT_ID,
+            from_chat_id=chat_id,
+            message_ids=message_ids,
+            disable_notification=True
+        )
+    except TelegramBadRequest as e:
+        # Telegram refuses a batch whose messages are all gone instead of forwarding nothing
+        if "no messages to forward" not in e.message.lower():
+            raise
+        forwarded = []
+    copies.extend(forwarded_id.message_id for forwarded_id in forwarded)
+
+    missing = len(message_ids) - len(forwarded)
+    if missing == 0:
+        return []
+    if missing == len(message_ids) or len(message_ids) == 1:
+        return message_ids
+
+    middle = len(message_ids) // 2
+    left = await probe_deleted(chat_id, message_ids[:middle], copies)
+    right = await probe_deleted(chat_id, message_ids[middle:], copies, missing - len(left))
+    return left + right
+
+async def discard_probe_copies(copies: list) -> None:
+    # Keep the probe chat empty, deleteMessages takes up to 100 ids per call
+    for start in range(0, len(copies), DELETION_PROBE_BATCH):
+        try:
+            await bot.delete_messages(chat_id=DELETION_PROBE_CHAT_ID, message_ids=copies[start:start + DELETION_PROBE_BATCH])
+        except Exception as e:
+            logger.warning("⚠️ Failed to clean up probe messages in chat %s: %s", DELETION_PROBE_CHAT_ID, e)
+
+async def report_deletions(chat_id: int, deleted: list) -> None:
+    # One notification per chat and scan, however many messages went missing
+    if len(deleted) == 1:
+        lines = [f"🗑️ <b>Message Deleted</b> by <b>{mention_for(deleted[0].user_id)}</b>"]
+    else:
+        lines = [f"🗑️ <b>{len(deleted)} Messages Deleted</b>"]
+
+    length = len(lines[0])
+    for index, msg_data in enumerate(deleted):
+        text = escape_text(msg_data.text[:400])
+        entry = f"<blockquote>{text}</blockquote>" if len(deleted) == 1 else f"{mention_for(msg_data.user_id)}: <blockquote>{text}</blockquote>"
+        if length + len(entry) + 40 > MAX_MESSAGE_LENGTH:
+            lines.append(f"…and {len(deleted) - index} more")
+            break
+        lines.append(entry)
+        length += len(entry) + 1
+
+    try:
+        await bot.send_message(chat_id=chat_id, text="\n".join(lines), parse_mode="HTML")
+        NOTIFICATIONS_SENT.inc("delete")
+        logger.info("✅ Deletion notification sent for %s messages in chat %s", len(deleted), chat_id)
     except Exception as e:
-        logger.error(f"❌ Cleanup error: {e}")
+        logger.error("❌ Failed to send deletion notification to chat %s: %s", chat_id, e)
+
+async def scan_chat_for_deletions(chat_id: int, fresh_only: bool = False) -> int:
+    # Probes the chat's cached window, or only ids never probed before; returns the batches used
+    candidates = deletion_tracker.candidates(chat_id, message_store, fresh_only)
+    batches = 0
+    deleted_ids = []
+    copies = []
+    try:
+        for start in range(0, len(candidates), DELETION_PROBE_BATCH):
+            batch = candidates[start:start + DELETION_PROBE_BATCH]
+            batches += 1
+            deleted_ids += await probe_deleted(chat_id, batch, copies)
+            deletion_tracker.mark_probed(chat_id, batch[-1])
+    except TelegramRetryAfter as e:
+        probe_bucket.pause(e.retry_after)
+        logger.warning("⚠️ Deletion probing rate limited - pausing %ss", e.retry_after)
+    except TelegramForbiddenError as e:
+        # The bot was removed from the chat, nothing there can be probed or reported any more
+        deletion_tracker.forget(chat_id)
+        logger.info("🚪 No longer in chat %s, dropped it from deletion probing: %s", chat_id, e)
+    except TelegramBadRequest as e:
+        if "protected content" in e.message.lower():
+            # Forwarding is disabled in the source chat, no probe there can ever succeed
+            deletion_tracker.unprobeable.add(chat_id)
+            logger.warning("⚠️ Chat %s cannot be probed for deletions, skipping it from now on: %s", chat_id, e)
+        else:
+            logger.warning("⚠️ Deletion probe of chat %s failed, retrying next pass: %s", chat_id, e)
+    finally:
+        if copies:
+            await discard_probe_copies(copies)
+
+    deleted = []
+    for message_id in deleted_ids:
+        msg_data = remove_message(chat_id, message_id)
+        if msg_data is not None:
+            deleted.append(msg_data)
+    if deleted:
+        DELETIONS_DETECTED.inc(amount=len(deleted))
+        logger.info("🗑️ Detected %s deleted messages in chat %s", len(deleted), chat_id)
+        await report_deletions(chat_id, deleted)
+    return batches
+
+async def scan_for_deletions(cursors: list) -> None:
+    # One pass capped at DELETION_PROBE_BUDGET batches so its length does not grow with the number of chats.
+    # Never-probed ids go first since most deletions follow soon after posting; leftover budget re-probes
+    # whole windows. Both walks resume where the last pass stopped, so every chat gets its turn.
+    budget = DELETION_PROBE_BUDGET
+    for phase, fresh_only in enumerate((True, False)):
+        chat_ids = deletion_tracker.chat_ids()
+        start = cursors[phase] % len(chat_ids) if chat_ids else 0
+        for chat_id in chat_ids[start:] + chat_ids[:start]:
+            if budget <= 0:
+                return
+            cursors[phase] += 1
+            if fresh_only and not deletion_tracker.has_fresh(chat_id):
+                continue
+            try:
+                budget -= await scan_chat_for_deletions(chat_id, fresh_only)
+            except Exception as e:
+                logger.error("❌ Deletion scan error for chat %s: %s", chat_id, e)
+
+# Broadcast engine
+class BroadcastJob:
+    """State of one running broadcast, shared by its workers and progress reporter"""
+
+    def __init__(self, owner_id: int, target: str, target_ids: list, from_chat_id: int, message_id: int):
+        self.owner_id = owner_id
+        self.target = target
+        self.target_ids = target_ids
+        self.from_chat_id = from_chat_id
+        self.message_id = message_id
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.cancelled = False
+        self.started_at = time.monotonic()
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def progress_text(self) -> str:
+        elapsed = max(time.monotonic() - self.started_at, 0.001)
+        return (
+            f"📡 <b>Broadcast in progress...</b>\n\n"
+            f"✅ <b>Sent:</b> {self.sent}\n"
+            f"❌ <b>Failed:</b> {self.failed}\n"
+            f"⏳ <b>Remaining:</b> {len(self.target_ids) - self.done}\n"
+            f"⚡ <b>Rate:</b> {self.done / elapsed:.1f} msg/s\n\n"
+            "Use /start to abort!"
+        )
+
+    def summary_text(self) -> str:
+        status = "🛑 <b>Cancelled:</b> stopped by /start\n" if self.cancelled else ""
+        return (
+            f"📊 <b>Broadcast Summary:</b>\n\n"
+            f"✅ <b>Sent:</b> {self.sent}\n"
+            f"❌ <b>Failed:</b> {self.failed}\n"
+            f"🎯 <b>Target:</b> {self.target}\n"
+            f"{status}\n"
+            "🔥 Broadcast mode is STILL ACTIVE! Send another message to continue your spam mission or use /start to abort! 📡💥"
+        )
+
+active_broadcasts: Dict[int, BroadcastJob] = {}
+
+async def _broadcast_worker(job: BroadcastJob, targets, global_bucket: TokenBucket, chat_limiter: ChatRateLimiter) -> None:
+    # Workers share one iterator, so every target is sent exactly once
+    for target_id in targets:
+        for attempt in range(BROADCAST_MAX_RETRIES + 1):
+            if job.cancelled:
+                return
+
+            await chat_limiter.acquire(target_id)
+            await global_bucket.acquire()
+            try:
+                await bot.copy_message(
+                    chat_id=target_id,
+                    from_chat_id=job.from_chat_id,
+                    message_id=job.message_id
+                )
+                job.sent += 1
+                logger.debug("✅ Broadcast sent to %s", target_id)
+                break
+            except TelegramRetryAfter as flood_error:
+                job.retried += 1
+                global_bucket.pause(flood_error.retry_after)
+                chat_limiter.pause(target_id, flood_error.retry_after)
+                logger.warning("⏳ Broadcast flood wait %ss on %s (attempt %s)", flood_error.retry_after, target_id, attempt + 1)
+                if attempt == BROADCAST_MAX_RETRIES:
+                    job.failed += 1
+            except Exception as broadcast_error:
+                job.failed += 1
+                logger.debug("❌ Broadcast failed to %s: %s", target_id, broadcast_error)
+                break
+
+async def _report_broadcast_progress(job: BroadcastJob, summary_message: Message, finished: asyncio.Event) -> None:
+    last_done = -1
+    while not finished.is_set():
+        try:
+            await asyncio.wait_for(finished.wait(), timeout=BROADCAST_PROGRESS_INTERVAL)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+        if job.done == last_done:
+            continue
+        last_done = job.done
+        try:
+            await summary_message.edit_text(job.progress_text(), parse_mode="HTML")
+        except Exception as edit_error:
+            logger.debug("❌ Broadcast progress update failed: %s", edit_error)
+
+async def run_broadcast(job: BroadcastJob, summary_message: Message) -> None:
+    # Bounded worker pool behind a global and a per-chat token bucket
+    active_broadcasts[job.owner_id] = job
+    global_bucket = TokenBucket(BROADCAST_GLOBAL_RATE)
+    chat_limiter = ChatRateLimiter(BROADCAST_PER_CHAT_RATE)
+    targets = iter(job.target_ids)
+    finished = asyncio.Event()
+
+    logger.info("📤 Starting broadcast to %s %s with %s workers", len(job.target_ids), job.target, BROADCAST_WORKERS)
+    reporter = asyncio.create_task(_report_broadcast_progress(job, summary_message, finished))
+    try:
+        await asyncio.gather(*(
+            _broadcast_worker(job, targets, global_bucket, chat_limiter)
+            for _ in range(min(BROADCAST_WORKERS, len(job.target_ids)) or 1)
+        ))
+    except Exception as e:
+        logger.error("❌ Broadcast engine error: %s", e)
+    finally:
+        finished.set()
+        await reporter
+        if active_broadcasts.get(job.owner_id) is job:
+            del active_broadcasts[job.owner_id]
+
+    try:
+        await summary_message.edit_text(job.summary_text(), parse_mode="HTML")
+    except Exception as edit_error:
+        logger.error("❌ Failed to send broadcast summary: %s", edit_error)
+
+    logger.info("📊 Broadcast completed - Success: %s, Failed: %s, Retries: %s, Cancelled: %s", job.sent, job.failed, job.retried, job.cancelled)
+
+async def reply_or_apologize(send, message: Message, apology: str) -> None:
+    # Posted from a command handler that has already returned, so a failed reply is apologised for here
+    try:
+        await send
+    except OutboundDropped:
+        raise
+    except Exception as e:
+        logger.error("❌ Command reply in chat %s failed: %s", message.chat.id, e)
+        try:
+            await message.reply(apology)
+        except Exception as reply_error:
+            logger.error("❌ Failed to send error reply: %s", reply_error)
 
 # Handler functions with decorators - NOW dp is initialized!
+# Command replies are posted through the outbound scheduler, a handler never waits on pacing while it holds its chat's turn
 @dp.message(Command("start"))
 async def start_command(message: Message) -> None:
     try:
@@ -441,16 +2589,23 @@ async def start_command(message: Message) -> None:
         log_with_user_info("INFO", "🚀 /start command received", user_info)
         
         if message.from_user:
-            user_ids.add(message.from_user.id)
-            logger.debug(f"👤 User {message.from_user.id} added to user_ids set")
+            track_user(message.from_user.id)
+            logger.debug("👤 User %s added to user_ids set", message.from_user.id)
+        
+        # Cancel a running broadcast
+        if message.from_user and message.from_user.id in active_broadcasts:
+            active_broadcasts[message.from_user.id].cancel()
+            logger.info("📡 Running broadcast cancelled by user %s", message.from_user.id)
+            outbound_scheduler.post(message.reply("🌷 Broadcast's off! Spam mission canceled, sweetie! 📡💥", parse_mode="HTML"), "/start reply")
+            return
         
         # Cancel broadcast mode if active
         if message.from_user and message.from_user.id in broadcast_mode:
             broadcast_mode.discard(message.from_user.id)
             if message.from_user.id in broadcast_target:
                 del broadcast_target[message.from_user.id]
-            logger.info(f"📡 Broadcast mode cancelled for user {message.from_user.id}")
-            await message.reply("🌷 Broadcast's off! Spam mission canceled, sweetie! 📡💥", parse_mode="HTML")
+            logger.info("📡 Broadcast mode cancelled for user %s", message.from_user.id)
+            outbound_scheduler.post(message.reply("🌷 Broadcast's off! Spam mission canceled, sweetie! 📡💥", parse_mode="HTML"), "/start reply")
             return
         
         # Create user mention
@@ -467,32 +2622,33 @@ async def start_command(message: Message) -> None:
             InlineKeyboardButton(text="Support", url=GROUP_URL)
         )
         
-        bot_info = await bot.get_me()
+        await bot_identity.ensure()
         builder.row(
             InlineKeyboardButton(
                 text="Add Me To Your Group", 
-                url=f"https://t.me/{bot_info.username}?startgroup=true"
+                url=f"https://t.me/{bot_identity.username}?startgroup=true"
             )
         )
         
         # Get random image
         random_image = random.choice(IMAGES)
         
-        await message.reply_photo(
-            photo=random_image,
-            caption=welcome_text, 
-            reply_markup=builder.as_markup(), 
-            parse_mode="HTML"
-        )
+        outbound_scheduler.post(reply_or_apologize(
+            photo_cache.reply(
+                message,
+                random_image,
+                caption=welcome_text, 
+                reply_markup=builder.as_markup(), 
+                parse_mode="HTML"
+            ),
+            message, "🌷 Oops! My circuits glitched. Try again, please! ⚡"
+        ), "/start reply")
         log_with_user_info("INFO", "✅ /start command completed successfully", user_info)
         
     except Exception as e:
-        user_info = extract_user_info(message) if message else {"user_id": "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ Start command error: {e}", user_info)
-        try:
-            await message.reply("🌷 Oops! My circuits glitched. Try again, please! ⚡")
-        except Exception as reply_error:
-            logger.error(f"❌ Failed to send error reply: {reply_error}")
+        user_info = extract_user_info(message)
+        log_with_user_info("ERROR", "❌ Start command error: %s", user_info, e)
+        outbound_scheduler.post(message.reply("🌷 Oops! My circuits glitched. Try again, please! ⚡"), "/start error reply")
 
 @dp.message(Command("help"))
 async def help_command(message: Message) -> None:
@@ -501,8 +2657,8 @@ async def help_command(message: Message) -> None:
         log_with_user_info("INFO", "❓ /help command received", user_info)
         
         if message.from_user:
-            user_ids.add(message.from_user.id)
-            logger.debug(f"👤 User {message.from_user.id} added to user_ids set")
+            track_user(message.from_user.id)
+            logger.debug("👤 User %s added to user_ids set", message.from_user.id)
         
         # Create user mention
         if message.from_user:
@@ -519,47 +2675,51 @@ async def help_command(message: Message) -> None:
         # Get random image
         random_image = random.choice(IMAGES)
         
-        await message.reply_photo(
-            photo=random_image,
-            caption=help_text, 
-            reply_markup=builder.as_markup(), 
-            parse_mode="HTML"
-        )
+        outbound_scheduler.post(reply_or_apologize(
+            photo_cache.reply(
+                message,
+                random_image,
+                caption=help_text, 
+                reply_markup=builder.as_markup(), 
+                parse_mode="HTML"
+            ),
+            message, "🌷 Uh oh! Help system crashed! Trying to fix it! 🔧"
+        ), "/help reply")
         log_with_user_info("INFO", "✅ /help command completed successfully", user_info)
         
     except Exception as e:
-        user_info = extract_user_info(message) if message else {"user_id": "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ Help command error: {e}", user_info)
-        try:
-            await message.reply("🌷 Uh oh! Help system crashed! Trying to fix it! 🔧")
-        except Exception as reply_error:
-            logger.error(f"❌ Failed to send help error reply: {reply_error}")
+        user_info = extract_user_info(message)
+        log_with_user_info("ERROR", "❌ Help command error: %s", user_info, e)
+        outbound_scheduler.post(message.reply("🌷 Uh oh! Help system crashed! Trying to fix it! 🔧"), "/help error reply")
 
 @dp.message(Command("ping"))
-async def ping_command(message: Message) -> None:
+async def ping_command(message: Message, command: CommandObject) -> None:
     try:
         user_info = extract_user_info(message)
         log_with_user_info("INFO", "🏓 /ping command received", user_info)
         
         if message.from_user:
-            user_ids.add(message.from_user.id)
-        
-        start_time = time.time()
-        bot_info = await bot.get_me()
-        response_time = round((time.time() - start_time) * 1000, 2)
+            track_user(message.from_user.id)
         
-        status_text = f'🏓 <a href="{GROUP_URL}">Pong!</a> {response_time}ms'
+        # "/ping api" measures a fresh Bot API round trip, plain /ping reports the last measurement
+        if (command.args or "").strip().lower() == "api" or bot_identity.latency_ms is None:
+            await bot_identity.refresh()
+            status_text = f'🏓 <a href="{GROUP_URL}">Pong!</a> {bot_identity.latency_ms}ms'
+        else:
+            age = int(time.time() - bot_identity.refreshed_at)
+            status_text = f'🏓 <a href="{GROUP_URL}">Pong!</a> {bot_identity.latency_ms}ms <i>({age}s ago, /ping api to measure)</i>'
+        response_time = bot_identity.latency_ms
         
-        await message.reply(status_text, parse_mode="HTML", disable_web_page_preview=True)
-        log_with_user_info("INFO", f"✅ /ping command completed - Response time: {response_time}ms", user_info)
+        outbound_scheduler.post(reply_or_apologize(
+            message.reply(status_text, parse_mode="HTML", disable_web_page_preview=True),
+            message, "🏓 Pong! I'm alive!"
+        ), "/ping reply")
+        log_with_user_info("INFO", "✅ /ping command completed - Response time: %sms", user_info, response_time)
         
     except Exception as e:
-        user_info = extract_user_info(message) if message else {"user_id": "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ Ping command error: {e}", user_info)
-        try:
-            await message.reply("🏓 Pong! I'm alive!")
-        except Exception as reply_error:
-            logger.error(f"❌ Failed to send ping error reply: {reply_error}")
+        user_info = extract_user_info(message)
+        log_with_user_info("ERROR", "❌ Ping command error: %s", user_info, e)
+        outbound_scheduler.post(message.reply("🏓 Pong! I'm alive!"), "/ping error reply")
 
 @dp.message(Command("broadcast"))
 async def broadcast_command(message: Message) -> None:
@@ -569,10 +2729,10 @@ async def broadcast_command(message: Message) -> None:
         
         if not message.from_user or message.from_user.id != OWNER_ID:
             log_with_user_info("WARNING", "⛔ Unauthorized broadcast attempt", user_info)
-            response = await message.answer("⛔ This command is restricted.")
+            outbound_scheduler.post(message.answer("⛔ This command is restricted."), "/broadcast reply")
             return
 
-        user_ids.add(message.from_user.id)
+        track_user(message.from_user.id)
 
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
@@ -581,24 +2741,24 @@ async def broadcast_command(message: Message) -> None:
             ]
         ])
 
-        response = await message.answer(
-            "📣 <b>Choose broadcast target:</b>\n\n"
-            f"👥 <b>Users:</b> {len(user_ids)} individual users\n"
-            f"📢 <b>Groups:</b> {len(group_ids)} groups\n\n"
-            "Select where you want to send your broadcast message:",
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
+        outbound_scheduler.post(reply_or_apologize(
+            message.answer(
+                "📣 <b>Choose broadcast target:</b>\n\n"
+                f"👥 <b>Users:</b> {len(user_ids)} individual users\n"
+                f"📢 <b>Groups:</b> {len(group_ids)} groups\n\n"
+                "Select where you want to send your broadcast message:",
+                reply_markup=keyboard,
+                parse_mode="HTML"
+            ),
+            message, "🌷 Uh oh! Broadcast system had a meltdown! Hang tight! 📡🔥"
+        ), "/broadcast reply")
         
-        log_with_user_info("INFO", f"✅ Broadcast menu displayed - Users: {len(user_ids)}, Groups: {len(group_ids)}", user_info)
+        log_with_user_info("INFO", "✅ Broadcast menu displayed - Users: %s, Groups: %s", user_info, len(user_ids), len(group_ids))
         
     except Exception as e:
-        user_info = extract_user_info(message) if message else {"user_id": "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ Broadcast command error: {e}", user_info)
-        try:
-            await message.reply("🌷 Uh oh! Broadcast system had a meltdown! Hang tight! 📡🔥")
-        except Exception as reply_error:
-            logger.error(f"❌ Failed to send broadcast error reply: {reply_error}")
+        user_info = extract_user_info(message)
+        log_with_user_info("ERROR", "❌ Broadcast command error: %s", user_info, e)
+        outbound_scheduler.post(message.reply("🌷 Uh oh! Broadcast system had a meltdown! Hang tight! 📡🔥"), "/broadcast error reply")
 
 @dp.message(F.chat.type == "private")
 async def handle_private_message(message: Message) -> None:
@@ -608,54 +2768,31 @@ async def handle_private_message(message: Message) -> None:
         
         # Check broadcast mode first
         if message.from_user and message.from_user.id in broadcast_mode:
-            logger.info(f"📡 Processing broadcast message from user {message.from_user.id}")
+            logger.info("📡 Processing broadcast message from user %s", message.from_user.id)
             target = broadcast_target.get(message.from_user.id, "users")
+            if WORKER_PROCESSES > 1:
+                await persistence.refresh_known_ids()
             target_list = user_ids if target == "users" else group_ids
 
-            success_count = 0
-            failed_count = 0
-
-            logger.info(f"📤 Starting broadcast to {len(target_list)} {target}")
-            
-            for target_id in target_list:
-                try:
-                    await bot.copy_message(
-                        chat_id=target_id,
-                        from_chat_id=message.chat.id,
-                        message_id=message.message_id
-                    )
-                    success_count += 1
-                    logger.debug(f"✅ Broadcast sent to {target_id}")
-                except Exception as broadcast_error:
-                    failed_count += 1
-                    logger.debug(f"❌ Broadcast failed to {target_id}: {broadcast_error}")
-
-            # Send broadcast summary
-            await message.answer(
-                f"📊 <b>Broadcast Summary:</b>\n\n"
-                f"✅ <b>Sent:</b> {success_count}\n"
-                f"❌ <b>Failed:</b> {failed_count}\n"
-                f"🎯 <b>Target:</b> {target}\n\n"
-                "🔥 Broadcast mode is STILL ACTIVE! Send another message to continue your spam mission or use /start to abort! 📡💥",
-                parse_mode="HTML"
-            )
-
             # Remove from broadcast mode
             broadcast_mode.discard(message.from_user.id)
             if message.from_user.id in broadcast_target:
                 del broadcast_target[message.from_user.id]
 
-            logger.info(f"📊 Broadcast completed - Success: {success_count}, Failed: {failed_count}")
+            # Run in the background so the owner's chat stays responsive and /start can abort
+            job = BroadcastJob(message.from_user.id, target, list(target_list), message.chat.id, message.message_id)
+            summary_message = await message.answer(job.progress_text(), parse_mode="HTML")
+            asyncio.create_task(run_broadcast(job, summary_message))
             return
             
         # Track user ID
         if message.from_user:
-            user_ids.add(message.from_user.id)
-            logger.debug(f"👤 User {message.from_user.id} tracked in private message")
+            track_user(message.from_user.id)
+            logger.debug("👤 User %s tracked in private message", message.from_user.id)
                 
     except Exception as e:
-        user_info = extract_user_info(message) if message else {"user_id": "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ Private message handling error: {e}", user_info)
+        user_info = extract_user_info(message)
+        log_with_user_info("ERROR", "❌ Private message handling error: %s", user_info, e)
 
 @dp.message(F.content_type.in_({'text', 'photo', 'video', 'document', 'audio', 'voice', 'video_note', 'sticker', 'animation'}))
 async def handle_message(message: Message) -> None:
@@ -665,27 +2802,29 @@ async def handle_message(message: Message) -> None:
         
         # Track user and group IDs
         if message.from_user:
-            user_ids.add(message.from_user.id)
-            logger.debug(f"👤 User {message.from_user.id} added to tracking")
+            track_user(message.from_user.id)
+            logger.debug("👤 User %s added to tracking", message.from_user.id)
         
         if message.chat.type in ['group', 'supergroup']:
-            group_ids.add(message.chat.id)
+            track_group(message.chat.id)
             add_message(message.chat.id, message)
-            active_chats.add(message.chat.id)
-            logger.debug(f"📢 Group {message.chat.id} message cached")
+            track_active_chat(message.chat.id)
+            logger.debug("📢 Group %s message cached", message.chat.id)
         elif message.chat.type == 'private':
             logger.debug("💌 Private message - skipping cache")
             return
         
-        # Periodic cleanup trigger
-        total_cached = sum(len(chat_msgs) for chat_msgs in messages.values())
-        if total_cached % 100 == 0 and total_cached > 0:
-            logger.info(f"🧹 Triggering cleanup - Total cached messages: {total_cached}")
+        # Cleanup trigger driven by maintained counters, O(1) per message
+        if message_store.total_bytes >= CACHE_HIGH_WATER_BYTES:
+            logger.info("🧹 Triggering cleanup - Cache bytes: %s", message_store.total_bytes)
+            cleanup_expired()
+            enforce_memory_limit()
+        elif message_store.has_expired(time.time() - MESSAGE_TTL):
             cleanup_expired()
                 
     except Exception as e:
-        user_info = extract_user_info(message) if message else {"user_id": "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ Message handling error: {e}", user_info)
+        user_info = extract_user_info(message)
+        log_with_user_info("ERROR", "❌ Message handling error: %s", user_info, e)
 
 @dp.edited_message()
 async def handle_edited_message(edited_message: Message) -> None:
@@ -704,7 +2843,7 @@ async def handle_edited_message(edited_message: Message) -> None:
         original_msg = get_message(chat_id, message_id)
         
         if not original_msg:
-            logger.warning(f"⚠️ Original message {message_id} not found in cache - adding current version")
+            logger.warning("⚠️ Original message %s not found in cache - adding current version", message_id)
             add_message(chat_id, edited_message)
             return
         
@@ -720,76 +2859,35 @@ async def handle_edited_message(edited_message: Message) -> None:
         if not full_name:
             full_name = user.username if user.username else "Unknown User"
             
-        user_mention = f'<a href="tg://user?id={user.id}">{full_name}</a>'
+        user_mention = f'<a href="tg://user?id={user.id}">{html.escape(full_name)}</a>'
         
-        # Prepare edit notification
-        original_text = original_msg.get('text', '')[:400]
-        new_text = (edited_message.text or edited_message.caption or '')[:400]
-        
-        if original_text == new_text:
+        new_text = edited_message.text or edited_message.caption or ''
+        if original_msg.text == new_text:
             logger.debug("📝 Edit detected but text is identical - ignoring")
             return
         
-        logger.info(f"📝 Processing edit by {user.full_name} ({user.id}) - Message {message_id}")
-        
-        # HTML escape function
-        def escape_html(text):
-            if not text:
-                return "(No text)"
-            return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        
-        original_escaped = escape_html(original_text)
-        new_escaped = escape_html(new_text)
+        EDITS_DETECTED.inc()
+        logger.info("📝 Processing edit by %s (%s) - Message %s", user.full_name, user.id, message_id)
         
-        edit_notification = f"📝 <b>Message Edited</b> by <b>{user_mention}</b>"
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="👀️", callback_data=f"reveal_edit:{message_id}:{user.id}"),
-                InlineKeyboardButton(text="🗑️", callback_data=f"dismiss_edit:{message_id}")
-            ]
-        ])
-        
-        # Store edit data for reveal
-        edit_data_key = f"edit_{chat_id}_{message_id}"
-        edit_data_cache[edit_data_key] = {
-            'original': original_escaped,
-            'new': new_escaped,
-            'editor_id': user.id,
-            'editor_mention': user_mention
-        }
-        
-        logger.debug(f"💾 Edit data cached with key: {edit_data_key}")
+        # Extend the message's version chain, starting one from the cached text on the first edit
+        edit_data_key = (chat_id, message_id)
+        history = edit_data_cache.get(edit_data_key)
+        if history is None:
+            history = EditHistory(original_msg.text, user.id, user_mention)
+            edit_data_cache.put(edit_data_key, history)
+        history.editor_mention = user_mention
+        history.add_version(new_text)
+        persist_edit_history(chat_id, message_id, history)
+        logger.debug("💾 Edit history %s now at %s edits", edit_data_key, history.edits)
         
         # Update cache
         add_message(chat_id, edited_message)
         
-        # Send notification
-        try:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=edit_notification,
-                parse_mode="HTML",
-                reply_markup=keyboard,
-                reply_to_message_id=message_id
-            )
-            logger.info(f"✅ Edit notification sent for message {message_id}")
-        except Exception as send_error:
-            logger.warning(f"⚠️ Failed to reply to original message {message_id}: {send_error}")
-            try:
-                await bot.send_message(
-                    chat_id=chat_id,
-                    text=edit_notification,
-                    parse_mode="HTML",
-                    reply_markup=keyboard
-                )
-                logger.info(f"✅ Edit notification sent without reply for message {message_id}")
-            except Exception as fallback_error:
-                logger.error(f"❌ Failed to send edit notification: {fallback_error}")
+        schedule_edit_notification(chat_id, message_id, history)
                 
     except Exception as e:
-        user_info = extract_user_info(edited_message) if edited_message else {"user_id": "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ Edit handling error: {e}", user_info)
+        user_info = extract_user_info(edited_message)
+        log_with_user_info("ERROR", "❌ Edit handling error: %s", user_info, e)
 
 @dp.message(F.content_type == 'new_chat_members')
 async def handle_new_members(message: Message) -> None:
@@ -801,62 +2899,66 @@ async def handle_new_members(message: Message) -> None:
             logger.debug("💌 New member event in private chat - ignoring")
             return
         
-        bot_info = await bot.get_me()
+        await bot_identity.ensure()
         for new_member in message.new_chat_members:
-            logger.info(f"👤 New member: {new_member.full_name} ({new_member.id})")
-            if new_member.id == bot_info.id:
-                logger.info(f"🤖 Bot added to group {message.chat.id} ({message.chat.title})")
-                await message.reply(GROUP_WELCOME_MSG, parse_mode="Markdown")
-                active_chats.add(message.chat.id)
-                logger.info(f"✅ Welcome message sent and chat {message.chat.id} marked as active")
+            logger.info("👤 New member: %s (%s)", new_member.full_name, new_member.id)
+            if new_member.id == bot_identity.id:
+                logger.info("🤖 Bot added to group %s (%s)", message.chat.id, message.chat.title)
+                outbound_scheduler.post(send_group_welcome(message), f"welcome message to {message.chat.id}")
+                track_active_chat(message.chat.id)
+                logger.info("✅ Chat %s marked as active, welcome message queued", message.chat.id)
                 break
                 
     except Exception as e:
-        user_info = extract_user_info(message) if message else {"user_id": "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ New members handling error: {e}", user_info)
+        user_info = extract_user_info(message)
+        log_with_user_info("ERROR", "❌ New members handling error: %s", user_info, e)
+
+async def send_group_welcome(message: Message) -> None:
+    await message.reply(GROUP_WELCOME_MSG, parse_mode="Markdown")
+    NOTIFICATIONS_SENT.inc("welcome")
+    logger.info("✅ Welcome message sent to chat %s", message.chat.id)
+
+@dp.chat_member()
+async def handle_chat_member_update(event: ChatMemberUpdated) -> None:
+    try:
+        # Any promotion or demotion makes the cached admin set stale
+        admin_statuses = ('administrator', 'creator')
+        if event.old_chat_member.status in admin_statuses or event.new_chat_member.status in admin_statuses:
+            admin_cache.invalidate(event.chat.id)
+            logger.info(
+                "👮 Admin cache invalidated for chat %s - %s: %s -> %s",
+                event.chat.id, event.new_chat_member.user.id,
+                event.old_chat_member.status, event.new_chat_member.status
+            )
+    except Exception as e:
+        logger.error("❌ Chat member update handling error: %s", e)
 
 @dp.callback_query()
 async def handle_callback_query(callback_query: types.CallbackQuery) -> None:
     try:
-        user_info = {
-            "user_id": callback_query.from_user.id,
-            "username": callback_query.from_user.username,
-            "full_name": callback_query.from_user.full_name,
-            "chat_id": callback_query.message.chat.id if callback_query.message else None,
-            "chat_type": callback_query.message.chat.type if callback_query.message else None,
-            "chat_title": callback_query.message.chat.title if callback_query.message else "Unknown",
-            "chat_username": f"@{callback_query.message.chat.username}" if callback_query.message and callback_query.message.chat.username else "No Username",
-            "chat_link": f"https://t.me/{callback_query.message.chat.username}" if callback_query.message and callback_query.message.chat.username else "No Link",
-        }
+        user_info = LogContext(
+            callback_query.from_user,
+            callback_query.message.chat if callback_query.message else None
+        )
         
-        log_with_user_info("INFO", f"🔘 Callback query received: {callback_query.data}", user_info)
-        
-        # Handle help expand/minimize
-        if callback_query.data == "help_expand":
-            await handle_help_expand(callback_query)
-        elif callback_query.data == "help_minimize":
-            await handle_help_minimize(callback_query)
-        elif callback_query.data.startswith("reveal_edit:"):
-            await handle_reveal_edit(callback_query)
-        elif callback_query.data.startswith("dismiss_edit:"):
-            await handle_dismiss_edit(callback_query)
-        elif callback_query.data in ["broadcast_users", "broadcast_groups"]:
-            await handle_broadcast_target(callback_query)
-        else:
-            logger.warning(f"⚠️ Unknown callback data: {callback_query.data}")
+        log_with_user_info("INFO", "🔘 Callback query received: %s", user_info, callback_query.data)
+        
+        if not await callback_router.dispatch(callback_query):
+            logger.warning("⚠️ Unknown callback data: %s", callback_query.data)
             await callback_query.answer()
             
     except Exception as e:
-        user_info = {"user_id": callback_query.from_user.id if callback_query.from_user else "unknown", "full_name": "unknown"}
-        log_with_user_info("ERROR", f"❌ Callback query error: {e}", user_info)
+        user_info = LogContext(callback_query.from_user)
+        log_with_user_info("ERROR", "❌ Callback query error: %s", user_info, e)
         try:
             await callback_query.answer("🌷 Oops! Things didn't go as planned!", show_alert=True)
         except Exception as answer_error:
-            logger.error(f"❌ Failed to answer callback query: {answer_error}")
+            logger.error("❌ Failed to answer callback query: %s", answer_error)
 
+@callback_router.route("help_expand", rate=CALLBACK_ROUTE_RATE, capacity=CALLBACK_ROUTE_BURST)
 async def handle_help_expand(callback_query: types.CallbackQuery) -> None:
     try:
-        logger.info(f"📖 Help expand requested by {callback_query.from_user.full_name} ({callback_query.from_user.id})")
+        logger.info("📖 Help expand requested by %s (%s)", callback_query.from_user.full_name, callback_query.from_user.id)
         
         if callback_query.from_user:
             user_mention = f'<a href="tg://user?id={callback_query.from_user.id}">{callback_query.from_user.full_name}</a>'
@@ -876,18 +2978,19 @@ async def handle_help_expand(callback_query: types.CallbackQuery) -> None:
                 reply_markup=builder.as_markup(),
                 parse_mode="HTML"
             )
-            logger.info(f"✅ Help expanded for user {callback_query.from_user.id}")
+            logger.info("✅ Help expanded for user %s", callback_query.from_user.id)
             
     except Exception as e:
-        logger.error(f"❌ Help expand error for user {callback_query.from_user.id if callback_query.from_user else 'unknown'}: {e}")
+        logger.error("❌ Help expand error for user %s: %s", callback_query.from_user.id if callback_query.from_user else 'unknown', e)
         try:
             await callback_query.answer("🌷 Uh oh! Help expansion exploded on me! 💥", show_alert=True)
         except Exception as answer_error:
-            logger.error(f"❌ Failed to send help expand error: {answer_error}")
+            logger.error("❌ Failed to send help expand error: %s", answer_error)
 
+@callback_router.route("help_minimize", rate=CALLBACK_ROUTE_RATE, capacity=CALLBACK_ROUTE_BURST)
 async def handle_help_minimize(callback_query: types.CallbackQuery) -> None:
     try:
-        logger.info(f"📖 Help minimize requested by {callback_query.from_user.full_name} ({callback_query.from_user.id})")
+        logger.info("📖 Help minimize requested by %s (%s)", callback_query.from_user.full_name, callback_query.from_user.id)
         
         if callback_query.from_user:
             user_mention = f'<a href="tg://user?id={callback_query.from_user.id}">{callback_query.from_user.full_name}</a>'
@@ -907,136 +3010,123 @@ async def handle_help_minimize(callback_query: types.CallbackQuery) -> None:
                 reply_markup=builder.as_markup(),
                 parse_mode="HTML"
             )
-            logger.info(f"✅ Help minimized for user {callback_query.from_user.id}")
+            logger.info("✅ Help minimized for user %s", callback_query.from_user.id)
             
     except Exception as e:
-        logger.error(f"❌ Help minimize error for user {callback_query.from_user.id if callback_query.from_user else 'unknown'}: {e}")
+        logger.error("❌ Help minimize error for user %s: %s", callback_query.from_user.id if callback_query.from_user else 'unknown', e)
         try:
             await callback_query.answer("🌷 Uh oh! Help minimizer just melted down!", show_alert=True)
         except Exception as answer_error:
-            logger.error(f"❌ Failed to send help minimize error: {answer_error}")
+            logger.error("❌ Failed to send help minimize error: %s", answer_error)
 
+@callback_router.route("reveal_edit", rate=CALLBACK_ROUTE_RATE, capacity=CALLBACK_ROUTE_BURST)
 async def handle_reveal_edit(callback_query: types.CallbackQuery) -> None:
     try:
-        logger.info(f"👀 Edit reveal/hide requested by {callback_query.from_user.full_name} ({callback_query.from_user.id})")
+        logger.info("👀 Edit reveal/hide requested by %s (%s)", callback_query.from_user.full_name, callback_query.from_user.id)
         
-        parts = callback_query.data.split(":")
-        if len(parts) >= 3:
-            message_id = parts[1]
-            editor_id = int(parts[2])
-            
-            # Prevent editor from using buttons
-            if callback_query.from_user.id == editor_id:
-                logger.warning(f"⚠️ Editor {editor_id} tried to reveal their own edit")
-                await callback_query.answer("🌷 Nice try, sweetie! No spying on your mess!", show_alert=True)
-                return
+        chat_id = callback_query.message.chat.id
+        parsed = parse_edit_callback(callback_query.data, chat_id)
+        if parsed is None:
+            logger.warning("⚠️ Rejected reveal callback with bad data or signature: %s", callback_query.data)
+            await callback_query.answer("🌷 Hmm, that button doesn't look right, sweetie!", show_alert=True)
+            return
+        
+        reveal, message_id, editor_id = parsed
+        
+        # Prevent editor from using buttons
+        if callback_query.from_user.id == editor_id:
+            logger.warning("⚠️ Editor %s tried to reveal their own edit", editor_id)
+            await callback_query.answer("🌷 Nice try, sweetie! No spying on your mess!", show_alert=True)
+            return
+        
+        edit_data_key = (chat_id, message_id)
+        edit_data = edit_data_cache.get(edit_data_key) or await load_edit_history(chat_id, message_id)
+        
+        if edit_data:
+            # The signed button carries the view to switch to, no need to look at the message text
+            new_text = render_edit_notification(edit_data, revealed=reveal)
+            keyboard = edit_keyboard(chat_id, message_id, editor_id, revealed=reveal)
+            action = "revealed" if reveal else "hidden"
             
-            chat_id = callback_query.message.chat.id
-            edit_data_key = f"edit_{chat_id}_{message_id}"
+            # Answered first, the query must not expire while the edit waits its turn
+            await callback_query.answer(f"✨ Yay! Details {action} just perfectly 💕")
+            await callback_query.message.edit_text(
+                new_text,
+                parse_mode="HTML",
+                reply_markup=keyboard
+            )
+            logger.info("✅ Edit details %s for message %s by user %s", action, message_id, callback_query.from_user.id)
+        else:
+            logger.warning("⚠️ Edit data not found for key: %s", edit_data_key)
+            await callback_query.answer("🌷 Hmm, that edit data poofed away, sweetie!", show_alert=True)
             
-            if edit_data_key in edit_data_cache:
-                edit_data = edit_data_cache[edit_data_key]
-                
-                current_text = callback_query.message.text
-                is_revealed = "From:" in current_text and "To:" in current_text
-                
-                if is_revealed:
-                    new_text = f"📝 <b>Message Edited</b> by {edit_data['editor_mention']}"
-                    new_button_text = "👀️"
-                    action = "hidden"
-                else:
-                    new_text = (
-                        f"📝 <b>Message Edited</b> by {edit_data['editor_mention']}\n\n"
-                        f"<b>From:</b> {edit_data['original']}\n\n"
-                        f"<b>To:</b> {edit_data['new']}"
-                    )
-                    new_button_text = "✉️"
-                    action = "revealed"
-                
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [
-                        InlineKeyboardButton(text=new_button_text, callback_data=f"reveal_edit:{message_id}:{editor_id}"),
-                        InlineKeyboardButton(text="🗑️", callback_data=f"dismiss_edit:{message_id}")
-                    ]
-                ])
-                
-                await callback_query.message.edit_text(
-                    new_text,
-                    parse_mode="HTML",
-                    reply_markup=keyboard
-                )
-                
-                await callback_query.answer(f"✨ Yay! Details {action} just perfectly 💕")
-                logger.info(f"✅ Edit details {action} for message {message_id} by user {callback_query.from_user.id}")
-            else:
-                logger.warning(f"⚠️ Edit data not found for key: {edit_data_key}")
-                await callback_query.answer("🌷 Hmm, that edit data poofed away, sweetie!", show_alert=True)
-                
     except Exception as e:
-        logger.error(f"❌ Reveal edit error for user {callback_query.from_user.id if callback_query.from_user else 'unknown'}: {e}")
+        logger.error("❌ Reveal edit error for user %s: %s", callback_query.from_user.id if callback_query.from_user else 'unknown', e)
         try:
             await callback_query.answer("🌷 Oops! Reveal button got confused!", show_alert=True)
         except Exception as answer_error:
-            logger.error(f"❌ Failed to send reveal edit error: {answer_error}")
+            logger.error("❌ Failed to send reveal edit error: %s", answer_error)
 
+@callback_router.route("dismiss_edit", rate=CALLBACK_ROUTE_RATE, capacity=CALLBACK_ROUTE_BURST)
 async def handle_dismiss_edit(callback_query: types.CallbackQuery) -> None:
     try:
-        logger.info(f"🗑️ Edit dismiss requested by {callback_query.from_user.full_name} ({callback_query.from_user.id})")
+        logger.info("🗑️ Edit dismiss requested by %s (%s)", callback_query.from_user.full_name, callback_query.from_user.id)
         
-        parts = callback_query.data.split(":")
-        if len(parts) >= 2:
-            message_id = parts[1]
-            chat_id = callback_query.message.chat.id
-            edit_data_key = f"edit_{chat_id}_{message_id}"
-            
-            # Check if editor is trying to dismiss
-            if edit_data_key in edit_data_cache:
-                edit_data = edit_data_cache[edit_data_key]
-                editor_id = edit_data.get('editor_id')
-                
-                if callback_query.from_user.id == editor_id:
-                    logger.warning(f"⚠️ Editor {editor_id} tried to dismiss their own edit")
-                    await callback_query.answer("🌷 Trying to hide that mess? Not today, sweetie! 🌸", show_alert=True)
-                    return
+        chat_id = callback_query.message.chat.id
+        parsed = parse_edit_callback(callback_query.data, chat_id)
+        if parsed is None:
+            logger.warning("⚠️ Rejected dismiss callback with bad data or signature: %s", callback_query.data)
+            await callback_query.answer("🌷 Hmm, that button doesn't look right, sweetie!", show_alert=True)
+            return
+        
+        _, message_id, editor_id = parsed
+        edit_data_key = (chat_id, message_id)
+        
+        # Check if editor is trying to dismiss, the editor id travels in the signed button
+        if callback_query.from_user.id == editor_id:
+            logger.warning("⚠️ Editor %s tried to dismiss their own edit", editor_id)
+            await callback_query.answer("🌷 Trying to hide that mess? Not today, sweetie! 🌸", show_alert=True)
+            return
+        
+        # Check admin status
+        try:
+            is_admin = await admin_cache.is_admin(chat_id, callback_query.from_user.id)
+            logger.debug("👤 User %s admin status: %s", callback_query.from_user.id, is_admin)
             
-            # Check admin status
-            try:
-                chat_member = await bot.get_chat_member(chat_id, callback_query.from_user.id)
-                is_admin = chat_member.status in ['administrator', 'creator']
-                logger.debug(f"👤 User {callback_query.from_user.id} admin status: {is_admin} ({chat_member.status})")
-                
-                if not is_admin:
-                    logger.warning(f"⚠️ Non-admin {callback_query.from_user.id} tried to dismiss edit")
-                    await callback_query.answer("🌷 Wait up, sweetie! Only admins handle this mess! 🌸", show_alert=True)
-                    return
-            except Exception as admin_check_error:
-                logger.error(f"❌ Admin check error for user {callback_query.from_user.id}: {admin_check_error}")
-                await callback_query.answer("🧚‍♀️ Oops! My circuits fluttered away. Try again, darling!", show_alert=True)
+            if not is_admin:
+                logger.warning("⚠️ Non-admin %s tried to dismiss edit", callback_query.from_user.id)
+                await callback_query.answer("🌷 Wait up, sweetie! Only admins handle this mess! 🌸", show_alert=True)
                 return
+        except Exception as admin_check_error:
+            logger.error("❌ Admin check error for user %s: %s", callback_query.from_user.id, admin_check_error)
+            await callback_query.answer("🧚‍♀️ Oops! My circuits fluttered away. Try again, darling!", show_alert=True)
+            return
+        
+        # Allow dismiss for admins, answered before the delete so the query cannot expire behind it
+        await callback_query.answer("🌷 Poof! Edit floated away, babe!")
+        await callback_query.message.delete()
+        logger.info("✅ Edit notification dismissed by admin %s", callback_query.from_user.id)
+        
+        # Clean up cached data, a pending update must not resurrect the notification
+        cancel_edit_notification(edit_data_key)
+        persistence.enqueue('delete_edit_history', edit_data_key)
+        if edit_data_cache.pop(edit_data_key):
+            logger.debug("🧹 Edit data cache cleaned for key: %s", edit_data_key)
             
-            # Allow dismiss for admins
-            await callback_query.message.delete()
-            await callback_query.answer("🌷 Poof! Edit floated away, babe!")
-            logger.info(f"✅ Edit notification dismissed by admin {callback_query.from_user.id}")
-            
-            # Clean up cached data
-            if edit_data_key in edit_data_cache:
-                del edit_data_cache[edit_data_key]
-                logger.debug(f"🧹 Edit data cache cleaned for key: {edit_data_key}")
-                
     except Exception as e:
-        logger.error(f"❌ Dismiss edit error for user {callback_query.from_user.id if callback_query.from_user else 'unknown'}: {e}")
+        logger.error("❌ Dismiss edit error for user %s: %s", callback_query.from_user.id if callback_query.from_user else 'unknown', e)
         try:
             await callback_query.answer("🌷 Oops! Dismiss button malfunctioned!", show_alert=True)
         except Exception as answer_error:
-            logger.error(f"❌ Failed to send dismiss edit error: {answer_error}")
+            logger.error("❌ Failed to send dismiss edit error: %s", answer_error)
 
+@callback_router.route("broadcast_users", "broadcast_groups")
 async def handle_broadcast_target(callback_query: types.CallbackQuery) -> None:
     try:
-        logger.info(f"📡 Broadcast target selection by {callback_query.from_user.full_name} ({callback_query.from_user.id})")
+        logger.info("📡 Broadcast target selection by %s (%s)", callback_query.from_user.full_name, callback_query.from_user.id)
         
         if not callback_query.from_user or callback_query.from_user.id != OWNER_ID:
-            logger.warning(f"⚠️ Unauthorized broadcast target selection by {callback_query.from_user.id if callback_query.from_user else 'unknown'}")
+            logger.warning("⚠️ Unauthorized broadcast target selection by %s", callback_query.from_user.id if callback_query.from_user else 'unknown')
             await callback_query.answer("🌷 Not for you, sweetie, sorry!", show_alert=True)
             return
         
@@ -1047,7 +3137,7 @@ async def handle_broadcast_target(callback_query: types.CallbackQuery) -> None:
         broadcast_mode.add(callback_query.from_user.id)
         broadcast_target[callback_query.from_user.id] = target
         
-        logger.info(f"📡 Broadcast mode activated for owner - Target: {target}, Count: {len(target_list)}")
+        logger.info("📡 Broadcast mode activated for owner - Target: %s, Count: %s", target, len(target_list))
         
         await callback_query.answer(f"🌷 Broadcast's live! Time to stir the pot, {target}! 💥📡")
         
@@ -1065,11 +3155,11 @@ async def handle_broadcast_target(callback_query: types.CallbackQuery) -> None:
             logger.info("✅ Broadcast mode interface updated")
         
     except Exception as e:
-        logger.error(f"❌ Broadcast target selection error for user {callback_query.from_user.id if callback_query.from_user else 'unknown'}: {e}")
+        logger.error("❌ Broadcast target selection error for user %s: %s", callback_query.from_user.id if callback_query.from_user else 'unknown', e)
         try:
             await callback_query.answer("🌷 Oops! Broadcast selector broke!", show_alert=True)
         except Exception as answer_error:
-            logger.error(f"❌ Failed to send broadcast target error: {answer_error}")
+            logger.error("❌ Failed to send broadcast target error: %s", answer_error)
 
 async def set_bot_commands() -> None:
     try:
@@ -1081,84 +3171,374 @@ async def set_bot_commands() -> None:
         ]
         
         await bot.set_my_commands(commands)
-        logger.info(f"✅ Bot commands set successfully - {len(commands)} commands")
+        logger.info("✅ Bot commands set successfully - %s commands", len(commands))
         
     except Exception as e:
-        logger.error(f"❌ Failed to set bot commands: {e}")
+        logger.error("❌ Failed to set bot commands: %s", e)
 
-async def periodic_cleanup() -> None:
-    logger.info("🧹 Starting periodic cleanup task")
+async def expiry_scheduler() -> None:
+    logger.info("🧹 Starting expiry scheduler task")
+    last_stats = time.time()
     
     while True:
         try:
-            await asyncio.sleep(CLEANUP_INTERVAL)
-            logger.debug("🧹 Running periodic cleanup")
-            cleanup_expired()
+            await asyncio.sleep(EXPIRY_TICK_INTERVAL)
             
-            # Log stats every hour
-            total_messages = sum(len(msgs) for msgs in messages.values())
-            total_users = len(user_ids)
-            total_groups = len(group_ids)
+            # Expire in small batches, yielding to polling once the tick budget is spent
+            tick_start = time.perf_counter()
+            total_removed = 0
+            while True:
+                removed = cleanup_expired(EXPIRY_BATCH_SIZE)
+                total_removed += removed
+                if removed < EXPIRY_BATCH_SIZE:
+                    break
+                if time.perf_counter() - tick_start >= EXPIRY_TICK_BUDGET:
+                    await asyncio.sleep(0)
+                    tick_start = time.perf_counter()
             
-            logger.info(
-                f"📊 Stats - Active chats: {len(active_chats)}, "
-                f"Cached messages: {total_messages}, "
-                f"Users: {total_users}, "
-                f"Groups: {total_groups}"
-            )
+            total_removed += enforce_memory_limit()
+            total_removed += edit_data_cache.expire(EXPIRY_BATCH_SIZE)
+            for user_id in message_store.take_released_users():
+                user_table.forget(user_id)
+            if total_removed:
+                logger.debug("🧹 Expiry tick removed %s messages", total_removed)
+            
+            # Log stats periodically
+            if time.time() - last_stats >= CLEANUP_INTERVAL:
+                last_stats = time.time()
+                admin_cache.expire()
+                persistence.enqueue('expire_edit_histories', (int(time.time() - EDIT_CACHE_TTL),))
+                chat_latency.reset()
+                total_users = len(user_ids)
+                total_groups = len(group_ids)
+                
+                logger.info(
+                    "📊 Stats - Active chats: %s, Cached chats: %s, Cached messages: %s, Cache bytes: %s, "
+                    "Edit cache: %s (hits %s, misses %s, evictions %s), "
+                    "Admin cache: %s chats (hits %s, misses %s), Users: %s (%s named), Groups: %s, "
+                    "Dropped log records: %s",
+                    len(active_chats), message_store.active_chats, message_store.total_messages, message_store.total_bytes,
+                    len(edit_data_cache), edit_data_cache.hits, edit_data_cache.misses, edit_data_cache.evictions,
+                    len(admin_cache), admin_cache.hits, admin_cache.misses, total_users, len(user_table), total_groups,
+                    log_queue.dropped
+                )
             
         except Exception as e:
-            logger.error(f"❌ Periodic cleanup error: {e}")
+            logger.error("❌ Expiry scheduler error: %s", e)
             await asyncio.sleep(60)
 
-async def check_deleted_messages() -> None:
-    logger.info("🔍 Starting deleted message checker task")
+async def deletion_scanner() -> None:
+    logger.info("🕵️ Starting deletion scanner - probing via chat %s", DELETION_PROBE_CHAT_ID)
+    try:
+        await bot.get_chat(DELETION_PROBE_CHAT_ID)
+    except Exception as e:
+        logger.error("❌ Deletion probe chat %s is not reachable, deletion detection disabled: %s", DELETION_PROBE_CHAT_ID, e)
+        return
+    
+    cursors = [0, 0]
+    while True:
+        try:
+            await asyncio.sleep(DELETION_PROBE_INTERVAL)
+            await scan_for_deletions(cursors)
+        except Exception as e:
+            logger.error("❌ Deletion scanner error: %s", e)
+
+async def prewarm_photo_cache() -> None:
+    # Upload each uncached image once to the owner chat, keep the file_id and delete the message again
+    missing = [url for url in IMAGES if photo_cache.get(url) is None]
+    logger.info("🖼️ Pre-warming photo cache - %s of %s images to upload", len(missing), len(IMAGES))
+    
+    for url in missing:
+        try:
+            sent = await bot.send_photo(chat_id=OWNER_ID, photo=url, disable_notification=True)
+            photo_cache.remember(url, sent)
+            await bot.delete_message(chat_id=OWNER_ID, message_id=sent.message_id)
+        except TelegramRetryAfter as e:
+            logger.warning("⚠️ Photo pre-warm rate limited - waiting %ss", e.retry_after)
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            logger.warning("⚠️ Photo pre-warm failed for %s: %s", url, e)
+        await asyncio.sleep(PHOTO_PREWARM_INTERVAL)
+    
+    logger.info("✅ Photo cache pre-warmed - %s file_ids cached", len(photo_cache))
+
+async def monitor_event_loop_lag() -> None:
+    logger.info("⏱️ Starting event loop lag monitor")
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        scheduled_at = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(max(0.0, loop.time() - scheduled_at - LOOP_LAG_INTERVAL))
+
+async def refresh_bot_identity() -> None:
+    logger.info("🤖 Starting bot identity refresh task")
     
     while True:
         try:
-            await asyncio.sleep(60)
-            logger.debug("🔍 Checking for deleted messages")
-            
-            for chat_id in list(active_chats):
-                try:
-                    current_time = time.time()
-                    chat_messages = messages.get(chat_id, {})
-                    
-                    # Remove old messages from tracking
-                    expired_ids = []
-                    for msg_id, msg_data in chat_messages.items():
-                        if current_time - msg_data['timestamp'] > 7200:  # 2 hours
-                            expired_ids.append(msg_id)
-                    
-                    if expired_ids:
-                        logger.debug(f"🧹 Removing {len(expired_ids)} old tracked messages from chat {chat_id}")
-                        for msg_id in expired_ids:
-                            recent_message_ids[chat_id].discard(msg_id)
-                        
-                except Exception as chat_error:
-                    logger.error(f"❌ Message tracking error for chat {chat_id}: {chat_error}")
-                    continue
-                    
+            await asyncio.sleep(BOT_IDENTITY_REFRESH_INTERVAL)
+            await bot_identity.refresh()
         except Exception as e:
-            logger.error(f"❌ Deletion check error: {e}")
-            await asyncio.sleep(300)
+            logger.error("❌ Bot identity refresh error: %s", e)
 
 async def start_bot_polling() -> None:
     try:
         logger.info("🚀 Starting Sus Ninja Bot polling...")
-        bot_info = await bot.get_me()
-        logger.info(f"✅ Bot @{bot_info.username} (ID: {bot_info.id}) is running successfully!")
+        bot_info = await bot_identity.refresh()
+        logger.info("✅ Bot @%s (ID: %s) is running successfully!", bot_info.username, bot_info.id)
         
         await set_bot_commands()
+        await bot.delete_webhook(drop_pending_updates=True)
         logger.info("🎯 Starting polling loop...")
-        await dp.start_polling(bot, skip_updates=True)
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
         
     except Exception as e:
-        logger.error(f"❌ Bot polling start error: {e}")
+        logger.error("❌ Bot polling start error: %s", e)
         raise
 
+async def start_bot_webhook() -> None:
+    try:
+        logger.info("🚀 Starting Sus Ninja Bot webhook...")
+        bot_info = await bot_identity.refresh()
+        logger.info("✅ Bot @%s (ID: %s) is running successfully!", bot_info.username, bot_info.id)
+        
+        await set_bot_commands()
+        webhook_url = f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}"
+        await bot.set_webhook(
+            webhook_url,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=True
+        )
+        logger.info("🪝 Webhook set to %s", webhook_url)
+        
+        # Updates now arrive through the aiohttp app, wait here until asked to stop
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        await stop_event.wait()
+        logger.info("🛑 Webhook mode stopping")
+        
+    except Exception as e:
+        logger.error("❌ Bot webhook start error: %s", e)
+        raise
+
+def start_background_tasks(prewarm: bool = PREWARM_PHOTOS) -> None:
+    logger.info("🔄 Starting background tasks")
+    asyncio.create_task(expiry_scheduler())
+    asyncio.create_task(refresh_bot_identity())
+    asyncio.create_task(monitor_event_loop_lag())
+    if prewarm:
+        asyncio.create_task(prewarm_photo_cache())
+    if DELETION_PROBE_CHAT_ID:
+        asyncio.create_task(deletion_scanner())
+    else:
+        logger.info("🕵️ DELETION_PROBE_CHAT_ID not set - deletion detection disabled")
+    logger.info("✅ Background tasks started")
+
+# Sharding
+def update_shard_key(update: Update) -> int:
+    # Chat id when the update has one, else the sender, so a chat's updates always land on one worker
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat is not None:
+        return context.chat.id
+    if context.user is not None:
+        return context.user.id
+    return 0
+
+class ShardPool:
+    """Worker processes each owning the chats whose id maps to them, fed over one local pipe per worker"""
+
+    def __init__(self, count: int, session_factory=None):
+        self.count = count
+        self.session_factory = session_factory
+        self._context = None
+        self._processes: list = []
+        self._outboxes: list = []
+        self._senders: list = []
+        self._started: list = []
+        self._restarts: list = []
+        self._failed: list = []
+
+    def start(self) -> None:
+        # spawn, not fork: the parent already runs an event loop and a log listener thread
+        self._context = multiprocessing.get_context("spawn")
+        for shard in range(self.count):
+            self._processes.append(None)
+            self._outboxes.append(queue.Queue(SHARD_OUTBOX_LIMIT))
+            self._started.append(0.0)
+            self._restarts.append(0)
+            self._failed.append(False)
+            connection = self._spawn(shard)
+
+            # A thread per pipe keeps a slow worker from ever blocking the front event loop
+            thread = threading.Thread(target=self._send_loop, args=(shard, connection), name=f"shard-sender-{shard}", daemon=True)
+            thread.start()
+            self._senders.append(thread)
+        logger.info("🧩 Started %s worker processes", self.count)
+
+    def _spawn(self, shard: int):
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=run_shard_worker,
+            args=(shard, self.count, receiver, self.session_factory),
+            name=f"susninja-shard-{shard}",
+            daemon=True
+        )
+        process.start()
+        receiver.close()
+        self._processes[shard] = process
+        self._started[shard] = time.monotonic()
+        return sender
+
+    def _respawn(self, shard: int, connection):
+        # A dead worker is replaced; one that keeps dying is given up on loudly instead of restarted forever
+        connection.close()
+        process = self._processes[shard]
+        process.join(SHARD_STOP_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        if time.monotonic() - self._started[shard] > SHARD_RESTART_WINDOW:
+            self._restarts[shard] = 0
+        self._restarts[shard] += 1
+        if self._restarts[shard] > SHARD_RESTART_LIMIT:
+            self._failed[shard] = True
+            logger.error("💥 Worker %s died %s times in a row (exit code %s) - giving up, its chats are no longer handled",
+                         shard, self._restarts[shard], process.exitcode)
+            return None
+        SHARD_RESTARTS.inc(str(shard))
+        logger.error("💥 Worker %s exited with code %s - restarting it (%s/%s)", shard, process.exitcode, self._restarts[shard], SHARD_RESTART_LIMIT)
+        return self._spawn(shard)
+
+    def _send_loop(self, shard: int, connection) -> None:
+        # Updates already in a dead worker's pipe are lost, the one that found the pipe broken goes to its replacement
+        outbox = self._outboxes[shard]
+        resend = None
+        while connection is not None:
+            if resend is None:
+                try:
+                    payload = outbox.get(timeout=SHARD_HEALTH_INTERVAL)
+                except queue.Empty:
+                    if not self._processes[shard].is_alive():
+                        connection = self._respawn(shard, connection)
+                    continue
+                if payload is None:
+                    connection.close()
+                    return
+            else:
+                payload, resend = resend, None
+            try:
+                connection.send_bytes(payload)
+            except (BrokenPipeError, OSError) as e:
+                logger.error("❌ Worker %s pipe closed: %s", shard, e)
+                resend = payload
+                connection = self._respawn(shard, connection)
+
+        # Given up on: keep draining so neither submit nor stop can block on a full outbox
+        dropped = 1 if resend is not None else 0
+        while outbox.get() is not None:
+            dropped += 1
+        SHARD_DROPPED.inc(str(shard), amount=dropped)
+
+    def shard_for(self, key: int) -> int:
+        return key % self.count
+
+    def submit(self, update: Update, block: bool = False) -> Optional[int]:
+        # None when the update was dropped; only callers off the event loop should block on a full outbox
+        shard = self.shard_for(update_shard_key(update))
+        if self._failed[shard]:
+            raise RuntimeError(f"Worker {shard} is down after {SHARD_RESTART_LIMIT} restarts")
+        try:
+            self._outboxes[shard].put(update.model_dump_json(exclude_unset=True, by_alias=True).encode(), block)
+        except queue.Full:
+            SHARD_DROPPED.inc(str(shard))
+            logger.warning("⚠️ Worker %s is %s updates behind - dropping update %s", shard, SHARD_OUTBOX_LIMIT, update.update_id)
+            return None
+        return shard
+
+    def stop(self, timeout: float = SHARD_STOP_TIMEOUT) -> None:
+        # Closing a pipe tells its worker to finish what it has queued and exit
+        for outbox in self._outboxes:
+            outbox.put(None)
+        for thread in self._senders:
+            thread.join(timeout)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("⚠️ Worker %s did not stop in %ss - terminating", process.name, timeout)
+                process.terminate()
+        logger.info("🧩 Worker processes stopped")
+
+class ShardForwardMiddleware(BaseMiddleware):
+    """Outer update middleware of the front process, hands every update to its worker instead of a handler"""
+
+    def __init__(self, pool: ShardPool):
+        self.pool = pool
+
+    async def __call__(self, handler, event: Update, data: dict):
+        shard = self.pool.submit(event)
+        if shard is not None:
+            SHARD_UPDATES.inc(str(shard))
+
+def run_shard_worker(shard: int, shards: int, connection, session_factory=None) -> None:
+    # Worker process entry point
+    asyncio.run(_shard_worker_main(shard, shards, connection, session_factory))
+
+async def _shard_worker_main(shard: int, shards: int, connection, session_factory) -> None:
+    global bot, outbound_scheduler
+    logger.info("🧩 Worker %s/%s starting", shard, shards)
+    bot = Bot(token=BOT_TOKEN, session=session_factory() if session_factory else create_api_session())
+    # Chats are split between the workers, the bot-wide send rate is too
+    outbound_scheduler = OutboundScheduler(OUTBOUND_GLOBAL_RATE / shards)
+    if OUTBOUND_SCHEDULER:
+        bot.session.middleware(outbound_scheduler)
+    bot.session.middleware(ApiMetricsMiddleware())
+    await persistence.start(shard, shards)
+    await bot_identity.refresh()
+    start_background_tasks(prewarm=PREWARM_PHOTOS and shard == 0)
+
+    # Blocking pipe reads happen on a thread and are handed to the loop in arrival order
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    def read_loop() -> None:
+        while True:
+            try:
+                payload = connection.recv_bytes()
+            except (EOFError, OSError):
+                loop.call_soon_threadsafe(inbox.put_nowait, None)
+                return
+            loop.call_soon_threadsafe(inbox.put_nowait, payload)
+
+    threading.Thread(target=read_loop, name="shard-reader", daemon=True).start()
+
+    # Per-chat ordering and the concurrency cap come from the dispatcher's ChatOrderingMiddleware
+    in_flight: Set[asyncio.Task] = set()
+    handled = 0
+    try:
+        while True:
+            payload = await inbox.get()
+            if payload is None:
+                break
+            update = Update.model_validate_json(payload, context={"bot": bot})
+            task = asyncio.create_task(dp.feed_update(bot, update))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            handled += 1
+        if in_flight:
+            await asyncio.wait(in_flight)
+    finally:
+        await persistence.close()
+        await bot.session.close()
+        logger.info("🧩 Worker %s/%s stopped after %s updates", shard, shards, handled)
+
 async def main():
-    global bot
+    global bot, BOT_MODE
     logger.info("🚀 Starting main bot execution")
     
     if not BOT_TOKEN or BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
@@ -1167,30 +3547,54 @@ async def main():
     
     logger.info("✅ Bot token validation passed")
     
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        logger.error("❌ BOT_MODE=webhook needs WEBHOOK_URL - falling back to polling")
+        BOT_MODE = "polling"
+    
+    runner = None
+    shard_pool = None
     try:
-        # Start HTTP server thread
-        logger.info("🌐 Starting HTTP server thread")
-        threading.Thread(target=start_dummy_server, daemon=True).start()
-        logger.info("✅ HTTP server thread started successfully")
-        
         # Initialize bot (dp is already initialized at module level)
         logger.info("🔧 Initializing bot")
-        bot = Bot(token=BOT_TOKEN)
+        bot = Bot(token=BOT_TOKEN, session=create_api_session())
+        # Registered first so it wraps the metrics middleware, which then times each attempt on its own
+        if OUTBOUND_SCHEDULER:
+            bot.session.middleware(outbound_scheduler)
+        bot.session.middleware(ApiMetricsMiddleware())
+        
+        if WORKER_PROCESSES > 1:
+            # Front process: no caches of its own, every update goes to the worker owning its chat
+            shard_pool = ShardPool(WORKER_PROCESSES)
+            shard_pool.start()
+            dp.update.outer_middleware(ShardForwardMiddleware(shard_pool))
+            asyncio.create_task(monitor_event_loop_lag())
+        else:
+            # Warm start from persisted state before any update is handled
+            await persistence.start()
+            start_background_tasks()
         
-        # Start background tasks
-        logger.info("🔄 Starting background tasks")
-        asyncio.create_task(periodic_cleanup())
-        asyncio.create_task(check_deleted_messages())
-        logger.info("✅ Background tasks started")
+        # Health checks and metrics are served from this loop, no extra thread
+        runner = await start_web_server(create_web_app())
         
-        logger.info("🎯 Starting bot polling...")
-        await start_bot_polling()
+        if BOT_MODE == "webhook":
+            logger.info("🎯 Starting bot in webhook mode...")
+            await start_bot_webhook()
+        else:
+            logger.info("🎯 Starting bot polling...")
+            await start_bot_polling()
         
     except KeyboardInterrupt:
         logger.info("🛑 Bot stopped by user (Ctrl+C)")
     except Exception as e:
-        logger.error(f"💥 Bot crashed with critical error: {e}")
+        logger.error("💥 Bot crashed with critical error: %s", e)
         raise
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        if shard_pool is not None:
+            await asyncio.to_thread(shard_pool.stop)
+        await persistence.close()
+        logger.info("💾 Persistence closed - %s writes this run", persistence.written)
 
 if __name__ == "__main__":
     logger.info("🎬 Bot script started")
@@ -1198,25 +3602,10 @@ if __name__ == "__main__":
     try:
         logger.info("⚙️ Configuring asyncio event loop")
         
-        # Configure asyncio for performance
-        if hasattr(asyncio, 'set_event_loop_policy'):
-            if os.name == 'nt':
-                logger.info("🖥️ Windows detected - using ProactorEventLoopPolicy")
-                asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-            else:
-                logger.info("🐧 Unix/Linux detected - applying performance optimizations")
-                try:
-                    
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    
-                    executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
-                    loop.set_default_executor(executor)
-                    loop.set_debug(False)
-                    
-                    logger.info("✅ Asyncio optimizations enabled successfully")
-                except Exception as optimization_error:
-                    logger.warning(f"⚠️ Using default asyncio policy due to error: {optimization_error}")
+        # asyncio.run() creates its own loop; only the Windows policy needs setting beforehand
+        if os.name == 'nt':
+            logger.info("🖥️ Windows detected - using ProactorEventLoopPolicy")
+            asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
         
         logger.info("🚀 Launching main bot function")
         asyncio.run(main())
@@ -1224,5 +3613,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("✅ Bot shutdown completed gracefully")
     except Exception as critical_error:
-        logger.error(f"💀 Critical system error: {critical_error}")
+        logger.error("💀 Critical system error: %s", critical_error)
         raise
\ No newline at end of file